@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""Benchmark shaper against stub package managers and a local HTTP server.
+
+A throwaway HOME is populated with the repository's package lists, fake
+dnf, rpm, cargo, go, volta, npm, pip, fc-list, git and tar executables are
+put first on PATH, and HTTPS requests to go.dev, GitHub and font hosts are
+rewritten to a local server. Every shaper step function and full playbook
+run is then timed, twice: once against a cold cache and fresh system, and
+once again when everything is already in place.
+"""
+import argparse
+import fcntl
+import hashlib
+import http.server
+import io
+import json
+import os
+import pathlib
+import random
+import runpy
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import types
+import typing
+import urllib.parse
+import urllib.request
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+STUBS = ROOT / "bench" / "stubs.py"
+TOOLS = [
+    "sudo",
+    "dnf",
+    "rpm",
+    "cargo",
+    "go",
+    "volta",
+    "npm",
+    "node",
+    "pip",
+    "fc-list",
+    "fc-cache",
+    "git",
+    "tar",
+    "mktemp",
+    "command",
+    "rustup",
+]
+ECOSYSTEMS = {
+    "dnf": "packages/base_dnf.txt",
+    "cargo": "packages/base_rust.txt",
+    "go": "packages/base_go.txt",
+    "npm": "packages/base_npm.txt",
+    "pip": "packages/base_pip.txt",
+}
+
+
+def armored_key(seed: int) -> str:
+    """Build a minimal ASCII-armored OpenPGP v4 public key.
+
+    Args:
+        seed: makes each key distinct
+
+    Returns:
+        armored key block
+    """
+    import base64
+
+    body = b"\x04" + random.Random(seed).randbytes(140)
+    packet = bytes([0xC6, len(body)]) + body
+    encoded = base64.encodebytes(packet).decode()
+    return (
+        "-----BEGIN PGP PUBLIC KEY BLOCK-----\n\n"
+        f"{encoded}"
+        "-----END PGP PUBLIC KEY BLOCK-----\n"
+    )
+
+
+def tarball() -> bytes:
+    """Build a small gzipped tarball.
+
+    Returns:
+        tarball bytes
+    """
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        data = b"benchmark\n"
+        info = tarfile.TarInfo("bench/README")
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class Site(http.server.BaseHTTPRequestHandler):
+    """Local stand-in for go.dev, GitHub, and font and script hosts.
+
+    Request paths are /HOST/PATH, as rewritten by RewriteHandler.
+    """
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    archive = tarball()
+    font = random.Random(0).randbytes(200_000)
+
+    def log_message(self, *args) -> None:
+        """Keep quiet."""
+
+    def route(self) -> typing.Tuple[bytes, str]:
+        """Choose a response body for the request path.
+
+        Returns:
+            body and content type
+        """
+        host, _, path = self.path.lstrip("/").partition("/")
+        if host == "go.dev" and path.startswith("dl/?"):
+            release = {
+                "version": "go1.99.0",
+                "files": [
+                    {
+                        "os": "linux",
+                        "arch": arch,
+                        "kind": "archive",
+                        "filename": f"go1.99.0.linux-{arch}.tar.gz",
+                        "sha256": hashlib.sha256(self.archive).hexdigest(),
+                    }
+                    for arch in ("amd64", "arm64", "386", "armv6l")
+                ],
+            }
+            return json.dumps([release]).encode(), "application/json"
+        if host == "api.github.com":
+            return json.dumps({"name": "0.7.0"}).encode(), "application/json"
+        if path.endswith((".tar.gz", ".tgz")):
+            return self.archive, "application/gzip"
+        if "key" in path.lower() or path.endswith(".asc"):
+            return armored_key(hash(path) % 1000).encode(), "text/plain"
+        if host in ("get.volta.sh", "sh.rustup.rs"):
+            return b"true\n", "text/plain"
+        return self.font, "application/octet-stream"
+
+    def do_GET(self) -> None:
+        """Serve a routed body, honoring If-None-Match."""
+        time.sleep(self.latency)
+        body, content_type = self.route()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class RewriteHandler(urllib.request.BaseHandler):
+    """Send HTTPS requests to the local server instead."""
+
+    def __init__(self, port: int):
+        """Rewrite to a local port.
+
+        Args:
+            port: port of the local server
+        """
+        self.port = port
+
+    def https_request(self, req: urllib.request.Request) -> urllib.request.Request:
+        """Rewrite https://HOST/PATH to http://127.0.0.1:PORT/HOST/PATH.
+
+        Args:
+            req: the request
+
+        Returns:
+            the rewritten request
+        """
+        parts = urllib.parse.urlsplit(req.full_url)
+        req.full_url = f"http://127.0.0.1:{self.port}/{parts.netloc}{req.selector}"
+        return req
+
+
+def fake_dnf(inventory: pathlib.Path, rpmdb: pathlib.Path) -> types.ModuleType:
+    """Build a stand-in for the dnf Python bindings.
+
+    Args:
+        inventory: fake system inventory JSON file
+        rpmdb: file touched when packages are installed
+
+    Returns:
+        a module with a minimal dnf.Base
+    """
+    module = types.ModuleType("dnf")
+    module.exceptions = types.SimpleNamespace(Error=Exception)
+    module.query = types.SimpleNamespace(Query=list)
+
+    class Package(typing.NamedTuple):
+        name: str
+
+    class Base:
+        def __init__(self):
+            self.repos = {}
+            self.conf = types.SimpleNamespace(read=lambda: None)
+            self.pending = []
+            self.transaction = types.SimpleNamespace(install_set=[])
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            self.close()
+
+        def read_all_repos(self):
+            time.sleep(float(os.environ["SHAPER_BENCH_LATENCY"]))
+
+        def fill_sack(self, load_system_repo=True, load_available_repos=True):
+            time.sleep(float(os.environ["SHAPER_BENCH_LATENCY"]))
+            installed = json.loads(inventory.read_text())["dnf"]
+            self.sack = types.SimpleNamespace(
+                query=lambda: types.SimpleNamespace(
+                    installed=lambda: [Package(n) for n in installed]
+                )
+            )
+
+        def install(self, name):
+            self.pending.append(Package(name))
+
+        def resolve(self):
+            self.transaction.install_set = self.pending
+
+        def download_packages(self, packages):
+            pass
+
+        def package_signature_check(self, package):
+            return 0, ""
+
+        def do_transaction(self):
+            with open(inventory.with_suffix(".lock"), "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                data = json.loads(inventory.read_text())
+                data["dnf"] = sorted(set(data["dnf"]) | {p.name for p in self.pending})
+                temporary = inventory.with_suffix(f".{os.getpid()}")
+                temporary.write_text(json.dumps(data))
+                temporary.replace(inventory)
+            rpmdb.touch()
+
+        def close(self):
+            pass
+
+    module.Base = Base
+    return module
+
+
+def setup(workdir: pathlib.Path, size: int, latency: float) -> dict:
+    """Create the fake HOME, stub executables, and inventory.
+
+    Args:
+        workdir: empty scratch directory
+        size: number of unrelated packages already installed per ecosystem
+        latency: seconds each stub command sleeps
+
+    Returns:
+        dict of paths used by the benchmark
+    """
+    home = workdir / "home"
+    bin_dir = workdir / "bin"
+    for directory in (home / "shaper", home / "devel", bin_dir):
+        directory.mkdir(parents=True)
+    for subdir in ("packages", "repos", "fonts"):
+        shutil.copytree(ROOT / subdir, home / "shaper" / subdir)
+    (home / "devel" / "shaper").symlink_to(home / "shaper")
+    for tool in TOOLS:
+        wrapper = bin_dir / tool
+        script = f'exec "{sys.executable}" "{STUBS}" {tool} "$@"'
+        wrapper.write_text(f"#!/bin/sh\n{script}\n")
+        wrapper.chmod(0o755)
+    venv_bin = home / ".venv" / "bin"
+    venv_bin.mkdir(parents=True)
+    (venv_bin / "pip").symlink_to(bin_dir / "pip")
+    inventory = workdir / "inventory.json"
+    unrelated = {
+        ecosystem: [f"unrelated-{ecosystem}-{n}" for n in range(size)]
+        for ecosystem in ECOSYSTEMS
+    }
+    inventory.write_text(json.dumps({"rpm_keys": [], **unrelated}))
+    rpmdb = workdir / "rpmdb.sqlite"
+    rpmdb.touch()
+    return {"home": home, "bin": bin_dir, "inventory": inventory, "rpmdb": rpmdb}
+
+
+def timed(function: typing.Callable, *args) -> dict:
+    """Time a call.
+
+    Args:
+        function: callable to run
+        args: arguments for function
+
+    Returns:
+        dict with seconds, and error if the call raised
+    """
+    start = time.perf_counter()
+    try:
+        function(*args)
+    except BaseException as error:
+        return {"seconds": time.perf_counter() - start, "error": repr(error)}
+    return {"seconds": time.perf_counter() - start}
+
+
+def benchmark(size: int, latency: float, http_latency: float, workers: int) -> dict:
+    """Run the benchmark in a scratch directory.
+
+    Args:
+        size: number of unrelated packages already installed per ecosystem
+        latency: seconds each stub command sleeps
+        http_latency: seconds the local server waits before each response
+        workers: playbook concurrency
+
+    Returns:
+        results, keyed by phase and step or playbook
+    """
+    with tempfile.TemporaryDirectory(prefix="shaper-bench-") as tmpdirname:
+        paths = setup(pathlib.Path(tmpdirname), size, latency)
+        os.environ.update(
+            {
+                "HOME": str(paths["home"]),
+                "XDG_CACHE_HOME": str(paths["home"] / ".cache"),
+                "PATH": f"{paths['bin']}:{os.environ['PATH']}",
+                "SHAPER_BENCH_INVENTORY": str(paths["inventory"]),
+                "SHAPER_BENCH_LATENCY": str(latency),
+                "SHAPER_BENCH_RPMDB": str(paths["rpmdb"]),
+            }
+        )
+        sys.modules["dnf"] = fake_dnf(paths["inventory"], paths["rpmdb"])
+        sys.modules["dnf.exceptions"] = sys.modules["dnf"].exceptions
+        Site.latency = http_latency
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Site)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        sys.path.insert(0, str(ROOT))
+        import shaper.download
+        import shaper.golang
+        import shaper.util
+
+        shaper.download.opener = shaper.download.SafeOpener(
+            (
+                lambda: RewriteHandler(server.server_port),
+                urllib.request.UnknownHandler,
+                urllib.request.HTTPDefaultErrorHandler,
+                urllib.request.HTTPRedirectHandler,
+                shaper.download.PooledHTTPHandler,
+                urllib.request.HTTPErrorProcessor,
+            )
+        )
+        shaper.util.RPMDB = (paths["rpmdb"],)
+        shaper.golang.GOROOT = paths["home"] / "go-root"
+        shaper.golang.GOEXE = paths["bin"] / "go"
+        import shaper.dnf
+
+        shaper.dnf.DNF = ["sudo", "dnf"]
+        shaper.dnf.RPM = ["sudo", "rpm"]
+
+        results = {}
+        for playbook in ("headless-playbook.py", "workstation-playbook.py"):
+            book = runpy.run_path(str(ROOT / playbook))["playbook"]()
+            for phase in ("cold", "warm"):
+                for step in book.steps.values():
+                    results.setdefault(f"{phase}/steps", {})[
+                        f"{step.function.__module__}.{step.function.__name__}"
+                        f"({', '.join(map(str, step.args))})"
+                    ] = timed(book.run_step, step)
+            for phase in ("cold", "warm"):
+                if phase == "cold":
+                    reset(paths, size)
+                print(f"Running {playbook} ({phase})", file=sys.stderr)
+                results.setdefault(f"{phase}/playbooks", {})[playbook] = timed(
+                    book.run, workers
+                )
+            reset(paths, size)
+        server.shutdown()
+        return results
+
+
+def reset(paths: dict, size: int) -> None:
+    """Restore the fresh system and empty caches.
+
+    Args:
+        paths: as returned by setup
+        size: number of unrelated packages already installed per ecosystem
+    """
+    home = paths["home"]
+    for name in (".cache", ".dotfiles", "go", ".cargo", ".volta", ".local"):
+        shutil.rmtree(home / name, ignore_errors=True)
+    unrelated = {
+        ecosystem: [f"unrelated-{ecosystem}-{n}" for n in range(size)]
+        for ecosystem in ECOSYSTEMS
+    }
+    paths["inventory"].write_text(json.dumps({"rpm_keys": [], **unrelated}))
+    paths["rpmdb"].touch()
+    import shaper.npm
+
+    shaper.npm.existing_npm.cache_clear()
+
+
+def run() -> None:
+    """Parse options, run the benchmark, and write JSON results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--size", type=int, default=1000, help="packages already installed"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="seconds per stub command"
+    )
+    parser.add_argument(
+        "--http-latency", type=float, default=0.02, help="seconds per HTTP response"
+    )
+    parser.add_argument("-j", "--workers", type=int, default=4)
+    parser.add_argument(
+        "-o", "--output", type=pathlib.Path, default=pathlib.Path("bench_output.json")
+    )
+    args = parser.parse_args()
+    started = time.time()
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        results = benchmark(args.size, args.latency, args.http_latency, args.workers)
+    finally:
+        sys.stdout = stdout
+    report = {
+        "started": started,
+        "python": sys.version.split()[0],
+        "config": {k: str(v) for k, v in vars(args).items()},
+        "results": results,
+    }
+    args.output.write_text(json.dumps(report, indent=2))
+    for phase, timings in results.items():
+        print(phase)
+        for name, timing in timings.items():
+            flag = "  ERROR " + timing["error"] if "error" in timing else ""
+            print(f"  {timing['seconds']:8.3f}s  {name}{flag}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Measure import time of each shaper module in a fresh interpreter."""
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+MODULES = sorted(
+    f"shaper.{p.stem}" for p in (ROOT / "shaper").glob("*.py") if p.stem != "__init__"
+)
+
+
+def import_time(module: str, runs: int = 5) -> dict:
+    """Time importing a module, keeping the fastest of several runs.
+
+    Args:
+        module: dotted module name
+        runs: number of fresh interpreters to start
+
+    Returns:
+        dict with wall time of the interpreter and cumulative import time of
+        the module, in milliseconds, or an error message
+    """
+    best = {"wall_ms": float("inf"), "import_ms": float("inf")}
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+        wall = (time.perf_counter() - start) * 1000
+        if process.returncode:
+            return {"error": process.stderr.strip().splitlines()[-1]}
+        for line in process.stderr.splitlines():
+            fields = [f.strip() for f in line.split("|")]
+            if len(fields) == 3 and fields[2] == module:
+                best["import_ms"] = min(best["import_ms"], int(fields[1]) / 1000)
+        best["wall_ms"] = min(best["wall_ms"], wall)
+    return best
+
+
+def run() -> None:
+    """Print import times, and optionally save them as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("-o", "--output", type=pathlib.Path, help="JSON file")
+    args = parser.parse_args()
+    results = {module: import_time(module, args.runs) for module in args.modules}
+    for module, result in results.items():
+        if "error" in result:
+            print(f"{module:20} {result['error']}")
+        else:
+            print(
+                f"{module:20} import {result['import_ms']:8.1f} ms"
+                f"   interpreter {result['wall_ms']:8.1f} ms"
+            )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    run()
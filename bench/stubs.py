@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Stand-in package manager executables for the benchmark harness.
+
+Invoked as ``stubs.py TOOL ARGS...`` by wrapper scripts that the harness puts
+on PATH. Each stub sleeps for SHAPER_BENCH_LATENCY seconds, answers inventory
+queries from the JSON file named by SHAPER_BENCH_INVENTORY, and records
+installs there, so a second run sees an up-to-date system.
+"""
+import fcntl
+import json
+import os
+import pathlib
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+import shaper.dnf  # noqa: E402
+
+INVENTORY = pathlib.Path(os.environ["SHAPER_BENCH_INVENTORY"])
+LATENCY = float(os.environ.get("SHAPER_BENCH_LATENCY", "0"))
+
+
+def load() -> dict:
+    """Read the fake system inventory.
+
+    Returns:
+        a dict of ecosystem to list of installed names
+    """
+    return json.loads(INVENTORY.read_text())
+
+
+def record(ecosystem: str, names: list) -> None:
+    """Add installed names to the fake system inventory.
+
+    Args:
+        ecosystem: inventory key, such as cargo
+        names: names to add
+    """
+    with open(INVENTORY.with_suffix(".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        inventory = load()
+        inventory[ecosystem] = sorted(set(inventory[ecosystem]) | set(names))
+        temporary = INVENTORY.with_suffix(f".{os.getpid()}")
+        temporary.write_text(json.dumps(inventory))
+        temporary.replace(INVENTORY)
+
+
+def names(args: list) -> list:
+    """Drop options from an argument list.
+
+    Args:
+        args: command line arguments
+
+    Returns:
+        the arguments that are not options
+    """
+    return [a for a in args if not a.startswith("-")]
+
+
+def touch(path: str) -> None:
+    """Update a file's mtime, creating it, so inventory fingerprints change.
+
+    Args:
+        path: file to touch
+    """
+    target = pathlib.Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.touch()
+    os.utime(target.parent)
+
+
+def sudo(args: list) -> None:
+    """Run the rest of the command line, which finds other stubs on PATH.
+
+    Args:
+        args: command line arguments
+    """
+    if args[:1] != ["-v"]:
+        os.execvp(args[0], args)
+
+
+def rpm(args: list) -> None:
+    """Report the Fedora version, and list or import keys.
+
+    Args:
+        args: command line arguments
+    """
+    if args[:1] == ["-E"]:
+        print("40")
+    elif "--import" in args:
+        armored = [pathlib.Path(a).read_text() for a in args[1:]]
+        keys = [f for a in armored for f in shaper.dnf.rpm_key_fingerprints(a)]
+        record("rpm_keys", [k[-8:] for k in keys])
+        touch(os.environ["SHAPER_BENCH_RPMDB"])
+    elif "-qa" in args:
+        for key in load()["rpm_keys"]:
+            print(f"{key}\tBenchmark Packager")
+
+
+def dnf(args: list) -> None:
+    """Install packages.
+
+    Args:
+        args: command line arguments
+    """
+    if "install" in args:
+        record("dnf", names(args[args.index("install") + 1 :]))
+        touch(os.environ["SHAPER_BENCH_RPMDB"])
+
+
+def cargo(args: list) -> None:
+    """List or install crates.
+
+    Args:
+        args: command line arguments
+    """
+    if args == ["install", "--list"]:
+        for crate in load()["cargo"]:
+            print(f"{crate} v1.0.0:\n    {crate}")
+    elif args[:1] == ["install"]:
+        record("cargo", names(args[1:]))
+        touch(pathlib.Path.home() / ".cargo" / ".crates2.json")
+
+
+def go(args: list) -> None:
+    """Report the Go version, and list or install packages.
+
+    Args:
+        args: command line arguments
+    """
+    gopath = pathlib.Path.home() / "go" / "bin"
+    if args == ["version"]:
+        print("go version go1.0.0 linux/amd64")
+    elif args[:2] == ["version", "-m"]:
+        for package in load()["go"]:
+            print(f"{gopath}/{package.split('/')[-1]}: go1.0.0")
+            print(f"\tpath\t{package}")
+            print(f"\tmod\t{package}\tv1.0.0\th1:=")
+    elif args[:1] == ["install"] and "-n" not in args:
+        package = args[-1].rsplit("@", 1)[0]
+        record("go", [package])
+        touch(gopath / package.split("/")[-1])
+
+
+def volta(args: list) -> None:
+    """List or install npm packages.
+
+    Args:
+        args: command line arguments
+    """
+    if args[:1] == ["list"]:
+        for package in load()["npm"]:
+            print(f"package {package}@1.0.0 / node@20.0.0 npm@built-in")
+    elif "install" in args and "-g" in args:
+        record("npm", names(args[args.index("-g") + 1 :]))
+        packages = pathlib.Path.home() / ".volta" / "tools" / "user" / "packages"
+        touch(packages / "bench.json")
+
+
+def node(args: list) -> None:
+    """Report the node version.
+
+    Args:
+        args: command line arguments
+    """
+    print("v20.0.0")
+
+
+def pip(args: list) -> None:
+    """List or install Python packages.
+
+    Args:
+        args: command line arguments
+    """
+    if args[:1] == ["list"]:
+        print(json.dumps([{"name": p, "version": "1.0"} for p in load()["pip"]]))
+    elif args[:2] == ["install", "-Ur"]:
+        record("pip", pathlib.Path(args[2]).read_text().split())
+
+
+def git(args: list) -> None:
+    """Create the git directory of a dotfiles clone.
+
+    Args:
+        args: command line arguments
+    """
+    if "--separate-git-dir" in args:
+        git_dir = args[args.index("--separate-git-dir") + 1]
+        pathlib.Path(git_dir).mkdir(parents=True, exist_ok=True)
+
+
+def tar(args: list) -> None:
+    """Read and discard an archive from stdin.
+
+    Args:
+        args: command line arguments
+    """
+    while sys.stdin.buffer.read(1 << 16):
+        pass
+
+
+def mktemp(args: list) -> None:
+    """Create and print a staging directory in HOME.
+
+    Args:
+        args: command line arguments
+    """
+    staging = pathlib.Path.home() / f".bench-staging-{os.getpid()}"
+    staging.mkdir()
+    print(staging)
+
+
+TOOLS = {
+    "sudo": sudo,
+    "rpm": rpm,
+    "dnf": dnf,
+    "cargo": cargo,
+    "go": go,
+    "volta": volta,
+    "node": node,
+    "pip": pip,
+    "git": git,
+    "tar": tar,
+    "mktemp": mktemp,
+}
+
+
+def run(tool: str, args: list) -> int:
+    """Emulate a command; tools without a handler just succeed.
+
+    Args:
+        tool: command name
+        args: command line arguments
+
+    Returns:
+        exit status
+    """
+    time.sleep(LATENCY)
+    handler = TOOLS.get(tool)
+    if handler:
+        handler(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(sys.argv[1], sys.argv[2:]))
@@ -10,31 +10,86 @@ import shaper.golang
 import shaper.localpy
 import shaper.npm
 import shaper.rust
+import shaper.steps
 
 BASE = Path.home() / "devel" / "shaper"
 
 
-def run() -> None:
-    """Run commands in order."""
-    shaper.dnf.install_rpm_keys(f"{BASE}/packages/rpm_keys.json")
-    shaper.dnf.install_dnf_repos(f"{BASE}/repos/headless_repos.txt")
-    shaper.dnf.install_copr_repos(f"{BASE}/repos/headless_copr_repos.txt")
-    shaper.dnf.install_dnf_packages(f"{BASE}/packages/base_dnf.txt")
-    shaper.npm.install_npm_packages(f"{BASE}/packages/base_npm.txt")
-    shaper.golang.go_update()
-    shaper.golang.install_go_packages(f"{BASE}/packages/base_go.txt")
-    shaper.localpy.install_pip_packages(f"{BASE}/packages/base_pip.txt")
-    shaper.download.install_with_remote_script(
-        "rustup", "https://sh.rustup.rs", ["-y", "--no-modify-path"]
-    )
-    shaper.rust.install_rust_packages(f"{BASE}/packages/base_rust.txt")
-    shaper.dotfiles.dotfile_git_restore(
-        "base", "git@github.com:bowmanjd/dotfiles-base.git"
-    )
-    shaper.dotfiles.dotfile_git_restore(
-        "headless", "git@github.com:bowmanjd/dotfiles-headless.git"
+def playbook() -> shaper.steps.Playbook:
+    """Declare steps and their dependencies.
+
+    Returns:
+        the playbook
+    """
+    book = shaper.steps.Playbook()
+    book.add("rpm_keys", shaper.dnf.install_rpm_keys, f"{BASE}/packages/rpm_keys.json")
+    book.add(
+        "dnf_repos",
+        shaper.dnf.install_dnf_repos,
+        f"{BASE}/repos/headless_repos.txt",
+        after=["rpm_keys"],
+    )
+    book.add(
+        "copr_repos",
+        shaper.dnf.install_copr_repos,
+        f"{BASE}/repos/headless_copr_repos.txt",
+        after=["dnf_repos"],
+    )
+    book.add(
+        "dnf_packages",
+        shaper.dnf.install_dnf_packages,
+        f"{BASE}/packages/base_dnf.txt",
+        after=["copr_repos"],
+    )
+    book.add("volta", shaper.npm.install_volta)
+    book.add(
+        "npm_packages",
+        shaper.npm.install_npm_packages,
+        f"{BASE}/packages/base_npm.txt",
+        after=["volta"],
+    )
+    book.add("go", shaper.golang.go_update)
+    book.add(
+        "go_packages",
+        shaper.golang.install_go_packages,
+        f"{BASE}/packages/base_go.txt",
+        after=["go", "dnf_packages"],
+    )
+    book.add(
+        "pip_packages",
+        shaper.localpy.install_pip_packages,
+        f"{BASE}/packages/base_pip.txt",
+        after=["dnf_packages"],
+    )
+    book.add(
+        "rustup",
+        shaper.download.install_with_remote_script,
+        "rustup",
+        "https://sh.rustup.rs",
+        ["-y", "--no-modify-path"],
+    )
+    book.add(
+        "rust_packages",
+        shaper.rust.install_rust_packages,
+        f"{BASE}/packages/base_rust.txt",
+        after=["rustup", "dnf_packages"],
+    )
+    book.add(
+        "dotfiles_base",
+        shaper.dotfiles.dotfile_git_restore,
+        "base",
+        "git@github.com:bowmanjd/dotfiles-base.git",
+        after=["dnf_packages"],
+    )
+    book.add(
+        "dotfiles_headless",
+        shaper.dotfiles.dotfile_git_restore,
+        "headless",
+        "git@github.com:bowmanjd/dotfiles-headless.git",
+        after=["dnf_packages"],
     )
+    return book
 
 
 if __name__ == "__main__":
-    run()
+    playbook().main()
@@ -4,12 +4,16 @@
 import shaper.dnf
 import shaper.npm
 import shaper.fonts
+import shaper.steps
 import mysecrets.py
 
-shaper.dnf.install_rpm_keys()
-shaper.dnf.install_dnf_repos()
-shaper.dnf.install_copr_repos()
-shaper.dnf.install_rpmfusion()
-shaper.dnf.install_dnf_packages()
-shaper.npm.install_npm_packages()
-shaper.fonts.install_fonts()
+book = shaper.steps.Playbook()
+book.add("rpm_keys", shaper.dnf.install_rpm_keys)
+book.add("dnf_repos", shaper.dnf.install_dnf_repos, after=["rpm_keys"])
+book.add("copr_repos", shaper.dnf.install_copr_repos, after=["dnf_repos"])
+book.add("rpmfusion", shaper.dnf.install_rpmfusion, after=["copr_repos"])
+book.add("dnf_packages", shaper.dnf.install_dnf_packages, after=["rpmfusion"])
+book.add("volta", shaper.npm.install_volta)
+book.add("npm_packages", shaper.npm.install_npm_packages, after=["volta"])
+book.add("fonts", shaper.fonts.install_fonts)
+book.main()
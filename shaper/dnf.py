@@ -1,35 +1,241 @@
 """Utility functions for managing packages and repos with dnf."""
+import base64
 import functools
+import hashlib
 import json
+import os
 import pathlib
-import subprocess
-
-import dnf
+import tempfile
+import typing
 
+import shaper.download
 import shaper.util
 
 
 NPM = ["volta", "run", "--npm", "latest", "npm"]
 DNF = ["sudo", "/usr/bin/dnf"]
 RPM = ["sudo", "/usr/bin/rpm"]
-FEDORA_VERSION = subprocess.check_output(["rpm", "-E", "%fedora"], text=True).strip()
+REPOS_DIR = pathlib.Path("/etc/yum.repos.d")
+# Seconds a downloaded key is trusted to be current without asking again
+KEY_TTL = 24 * 3600
+
+if typing.TYPE_CHECKING:
+    import dnf
+
+
+def __getattr__(name: str) -> typing.Any:
+    """Compute expensive module attributes on first use.
+
+    Args:
+        name: attribute name
+
+    Returns:
+        attribute value
+
+    Raises:
+        AttributeError: if there is no such attribute
+    """
+    if name == "FEDORA_VERSION":
+        return fedora_version()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+@functools.cache
+def fedora_version() -> str:
+    """Obtain the Fedora release number.
+
+    Returns:
+        release number, such as "38"
+    """
+    return shaper.util.check_output(["rpm", "-E", "%fedora"], text=True).strip()
 
 
 @functools.cache
-def dnf_base() -> dnf.Base:
+def dnf_base() -> "dnf.Base":
+    """Load dnf configuration and repo definitions once per run.
+
+    Returns:
+        a dnf.Base, configured as by /etc/dnf/dnf.conf
+    """
+    import dnf
+
     base = dnf.Base()
+    base.conf.read()
     base.read_all_repos()
     return base
 
 
-def existing_rpm_keys() -> set:
-    """Obtain list of packagers of install gpg keys.
+def installed_package_names() -> set:
+    """Read installed package names from the system sack, without repo metadata.
+
+    Returns:
+        a set of package names
+    """
+    import dnf
+
+    with dnf.Base() as base:
+        base.fill_sack(load_system_repo=True, load_available_repos=False)
+        return {package.name for package in base.sack.query().installed()}
+
+
+@shaper.util.inventory_cache("rpm_keys", lambda: shaper.util.RPMDB)
+def existing_rpm_keys() -> dict:
+    """Obtain installed gpg keys.
 
     Returns:
-        a set of packager names
+        a dict of lowercase key ID (as rpm reports it) to packager name
     """
-    command = [*RPM, "-qa", "--qf", r"%{PACKAGER}\n", "gpg-pubkey*"]
-    return shaper.util.get_set_from_output(command)
+    command = ["rpm", "-qa", "--qf", r"%{VERSION}\t%{PACKAGER}\n", "gpg-pubkey*"]
+    return dict(
+        shaper.util.iter_output(
+            command, lambda line: line.split("\t", 1) if "\t" in line else None
+        )
+    )
+
+
+def openpgp_packets(data: bytes) -> typing.Iterator[typing.Tuple[int, bytes]]:
+    """Split binary OpenPGP data into packets.
+
+    Args:
+        data: binary (dearmored) OpenPGP data
+
+    Yields:
+        tuples of packet tag and packet body
+
+    Raises:
+        ValueError: if a packet is truncated, or uses partial body lengths,
+            which key packets never do
+    """
+    position = 0
+    while position < len(data):
+        header = data[position]
+        position += 1
+        try:
+            if header & 0x40:
+                tag = header & 0x3F
+                first = data[position]
+                if first < 192:
+                    length, position = first, position + 1
+                elif first < 224:
+                    length = ((first - 192) << 8) + data[position + 1] + 192
+                    position += 2
+                elif first == 255:
+                    length = int.from_bytes(data[position + 1 : position + 5], "big")
+                    position += 5
+                else:
+                    raise ValueError("Partial body lengths are not supported")
+            elif header & 0x03 == 3:
+                # Old format, indeterminate length: the packet runs to the end
+                tag = (header >> 2) & 0x0F
+                length = len(data) - position
+            else:
+                tag = (header >> 2) & 0x0F
+                size = (1, 2, 4)[header & 0x03]
+                length = int.from_bytes(data[position : position + size], "big")
+                position += size
+        except IndexError:
+            raise ValueError("Truncated OpenPGP packet header") from None
+        if position + length > len(data):
+            raise ValueError("Truncated OpenPGP packet")
+        yield tag, data[position : position + length]
+        position += length
+
+
+def rpm_key_fingerprints(armored: str) -> list:
+    """Compute fingerprints of the primary keys in an armored key file.
+
+    Args:
+        armored: ASCII-armored OpenPGP public key block(s)
+
+    Returns:
+        a list of lowercase hexadecimal v4 fingerprints
+
+    Raises:
+        ValueError: if the key data cannot be decoded
+    """
+    fingerprints = []
+    armored = armored.replace("\r", "")
+    for block in armored.split("-----BEGIN PGP PUBLIC KEY BLOCK-----")[1:]:
+        body = block.split("-----END PGP PUBLIC KEY BLOCK-----")[0]
+        lines = body.strip().split("\n\n", 1)[-1].splitlines()
+        encoded = "".join(line for line in lines if not line.startswith("="))
+        data = base64.b64decode(encoded)
+        for tag, packet in openpgp_packets(data):
+            if tag == 6 and packet[:1] == b"\x04":
+                prefix = b"\x99" + len(packet).to_bytes(2, "big")
+                fingerprints.append(hashlib.sha1(prefix + packet).hexdigest())
+    return fingerprints
+
+
+def rpm_key_installed(installed: dict, keyword: str, armored: str) -> bool:
+    """Determine if a key is installed, by fingerprint where possible.
+
+    Args:
+        installed: existing keys, as from existing_rpm_keys
+        keyword: packager search term, used if the key cannot be parsed
+        armored: ASCII-armored key
+
+    Returns:
+        True if installed
+    """
+    try:
+        fingerprints = rpm_key_fingerprints(armored)
+    except ValueError:
+        fingerprints = []
+    if fingerprints:
+        return all(f in installed or f[-8:] in installed for f in fingerprints)
+    return any(keyword in packager for packager in installed.values())
+
+
+def pending_rpm_keys(keys: typing.Iterable[dict]) -> dict:
+    """Fetch keys and find those not yet installed.
+
+    Keys come from the download cache, and are fetched again only once
+    KEY_TTL has passed, and then only if they changed.
+
+    Args:
+        keys: dicts with keyword and url
+
+    Returns:
+        a dict of URL to ASCII-armored key
+    """
+    installed = existing_rpm_keys()
+    pending = {}
+    for key in keys:
+        armored = shaper.download.fetch_cached(key["url"], ttl=KEY_TTL).read_text()
+        if not rpm_key_installed(installed, key["keyword"], armored):
+            pending[key["url"]] = armored
+    return pending
+
+
+def missing_rpm_keys(filename: str) -> set:
+    """Determine which rpm gpg keys listed in file are not installed.
+
+    Args:
+        filename: path to JSON file listing keys
+
+    Returns:
+        a set of key URLs
+    """
+    return set(pending_rpm_keys(json.loads(pathlib.Path(filename).read_text())))
+
+
+def import_rpm_keys(keys: typing.Iterable[dict]) -> None:
+    """Import any missing rpm gpg keys with a single rpm command.
+
+    Args:
+        keys: dicts with keyword and url
+    """
+    pending = pending_rpm_keys(keys)
+    if not pending:
+        return
+    with tempfile.TemporaryDirectory(prefix="rpmkeys-") as tmpdirname:
+        to_import = []
+        for number, armored in enumerate(pending.values()):
+            path = pathlib.Path(tmpdirname) / f"{number}.asc"
+            path.write_text(armored)
+            to_import.append(path)
+        shaper.util.check_call([*RPM, "--import", *to_import])
 
 
 def install_rpm_key(keyword: str, url: str) -> None:
@@ -39,9 +245,7 @@ def install_rpm_key(keyword: str, url: str) -> None:
         keyword: search term that, if present, identfies previously installed key
         url: URL to download key
     """
-    if not all(keyword in packager for packager in existing_rpm_keys()):
-        command = [*RPM, "--import", url]
-        subprocess.check_call(command)
+    import_rpm_keys([{"keyword": keyword, "url": url}])
 
 
 def install_rpm_keys(filename: str) -> None:
@@ -50,9 +254,7 @@ def install_rpm_keys(filename: str) -> None:
     Args:
         filename: path to text file listing repos
     """
-    keys = json.loads(pathlib.Path(filename).read_text())
-    for key in keys:
-        install_rpm_key(**key)
+    import_rpm_keys(json.loads(pathlib.Path(filename).read_text()))
 
 
 def existing_copr_repos() -> set:
@@ -77,16 +279,42 @@ def existing_dnf_repos() -> set:
     return {r.baseurl[0] for r in dnf_base().repos.values() if r.baseurl}
 
 
+def missing_copr_repos(filename: str) -> set:
+    """Determine which copr repositories listed in file are not enabled.
+
+    Args:
+        filename: path to text file listing repos
+
+    Returns:
+        a set of repo names
+    """
+    possible_repositories = shaper.util.get_set_from_file(filename)
+    return possible_repositories - existing_copr_repos()
+
+
+def missing_dnf_repos(filename: str) -> set:
+    """Determine which dnf repositories listed in file are not configured.
+
+    Args:
+        filename: path to text file listing repos
+
+    Returns:
+        a set of repo URLs
+    """
+    possible_urls = shaper.util.get_set_from_file(filename)
+    return possible_urls - existing_dnf_repos()
+
+
 def install_copr_repos(filename: str) -> None:
     """Install copr repositories from file.
 
     Args:
         filename: path to text file listing repos
     """
-    possible_repositories = shaper.util.get_set_from_file(filename)
-    to_install = possible_repositories - existing_copr_repos()
+    to_install = missing_copr_repos(filename)
     if to_install:
-        subprocess.check_call([*DNF, "copr", "enable", "-y", *to_install])
+        shaper.util.check_call([*DNF, "copr", "enable", "-y", *to_install])
+        dnf_base.cache_clear()
 
 
 def install_dnf_repos(filename: str) -> None:
@@ -95,47 +323,115 @@ def install_dnf_repos(filename: str) -> None:
     Args:
         filename: path to text file listing repos
     """
-    possible_urls = shaper.util.get_set_from_file(filename)
-    to_install = possible_urls - existing_dnf_repos()
+    to_install = missing_dnf_repos(filename)
     if to_install:
-        subprocess.check_call([*DNF, "config-manager", "--add-repo", *to_install])
+        shaper.util.check_call([*DNF, "config-manager", "--add-repo", *to_install])
+        dnf_base.cache_clear()
+
+
+def missing_rpmfusion() -> set:
+    """Determine which rpmfusion release packages are not installed.
+
+    Returns:
+        a set of package names
+    """
+    return {"rpmfusion-free-release", "rpmfusion-nonfree-release"} - existing_dnf()
 
 
 def install_rpmfusion() -> None:
     """Install rpmfusion repositories."""
-    if not {"rpmfusion-free-release", "rpmfusion-nonfree-release"}.issubset(
-        existing_dnf()
-    ):
-        subprocess.check_call(
+    if missing_rpmfusion():
+        version = fedora_version()
+        shaper.util.check_call(
             [
                 *DNF,
                 "install",
                 "-y",
-                f"https://download1.rpmfusion.org/free/fedora/rpmfusion-free-release-{FEDORA_VERSION}.noarch.rpm",
-                f"https://download1.rpmfusion.org/nonfree/fedora/rpmfusion-nonfree-release-{FEDORA_VERSION}.noarch.rpm",
+                f"https://download1.rpmfusion.org/free/fedora/rpmfusion-free-release-{version}.noarch.rpm",
+                f"https://download1.rpmfusion.org/nonfree/fedora/rpmfusion-nonfree-release-{version}.noarch.rpm",
             ]
         )
 
 
+@shaper.util.inventory_cache("dnf", lambda: shaper.util.RPMDB)
 def existing_dnf() -> set:
     """Obtain list of user installed packages.
 
     Returns:
         a set of package names
     """
-    command = ["dnf", "repoquery", "--installed", "--queryformat", "%{name}"]
-    return shaper.util.get_set_from_output(command)
+    return installed_package_names()
+
+
+def dnf_transaction(packages: typing.Iterable[str]) -> None:
+    """Install packages in-process, reusing the loaded repo metadata.
+
+    Requires root. Package signatures are checked, and missing repo keys
+    imported, as dnf -y would.
+
+    Scriptlets inherit the environment of this process, so ACCEPT_EULA is
+    set in it while the transaction runs. Commands started meanwhile by
+    other steps inherit it too, so run this only when no other step runs.
+
+    Args:
+        packages: package names to install
+
+    Raises:
+        Error: if a package signature is bad
+    """
+    import dnf.exceptions
+
+    base = dnf_base()
+    base.conf.assumeyes = True
+    base.fill_sack(load_system_repo=True, load_available_repos=True)
+    for package in packages:
+        base.install(package)
+    base.resolve()
+    install_set = list(base.transaction.install_set)
+    base.download_packages(install_set)
+    for package in install_set:
+        result, error = base.package_signature_check(package)
+        if result == 1:
+            base.package_import_key(package, askcb=lambda *args: True)
+        elif result:
+            raise dnf.exceptions.Error(error)
+    previous = os.environ.get("ACCEPT_EULA")
+    os.environ["ACCEPT_EULA"] = "Y"
+    try:
+        base.do_transaction()
+    finally:
+        if previous is None:
+            del os.environ["ACCEPT_EULA"]
+        else:
+            os.environ["ACCEPT_EULA"] = previous
+        base.close()
+        dnf_base.cache_clear()
+
+
+def missing_dnf_packages(filename: str) -> set:
+    """Determine which packages listed in file are not installed.
+
+    Args:
+        filename: path to text file listing packages
+
+    Returns:
+        a set of package names
+    """
+    return shaper.util.get_set_from_file(filename) - existing_dnf()
 
 
-def install_dnf_packages(filename: str) -> None:
+def install_dnf_packages(filename: str, in_process: bool = False) -> None:
     """Install packages from text file using dnf.
 
     Args:
         filename: path to text file listing repos
+        in_process: when running as root, install through the dnf API rather
+            than the dnf command; see dnf_transaction for why the step must
+            then run alone
     """
-    to_install = shaper.util.get_set_from_file(filename)
-    existing = existing_dnf()
-    new_packages = to_install - existing
-    if new_packages:
+    new_packages = missing_dnf_packages(filename)
+    if new_packages and in_process and os.geteuid() == 0:
+        dnf_transaction(new_packages)
+    elif new_packages:
         cmd = [*DNF, "install", "-y", *new_packages]
-        subprocess.check_call(cmd, env={"ACCEPT_EULA": "Y"})
+        shaper.util.check_call(cmd, env={**os.environ, "ACCEPT_EULA": "Y"})
@@ -1,11 +1,28 @@
+import concurrent.futures
+import hashlib
 import os
 import pathlib
 import subprocess
 import tempfile
+import threading
+import typing
+
+import shaper.util
 
 
 HOME = pathlib.Path.home()
 DOTFILES = HOME / ".dotfiles"
+MIRRORS = shaper.util.CACHE_DIR / "git"
+STATUS_CONFIG = [
+    "-c",
+    "core.preloadIndex=true",
+    "-c",
+    "core.untrackedCache=true",
+    "-c",
+    "status.showUntrackedFiles=no",
+]
+
+mirror_lock = threading.Lock()
 
 
 def ssh_agent_info() -> dict:
@@ -13,13 +30,13 @@ def ssh_agent_info() -> dict:
     agent_socket = HOME / ".ssh-agent.sock"
     shell_script = ""
     try:
-        subprocess.check_call(
+        shaper.util.check_call(
             ["pidof", "-s", "ssh-agent"],
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
         )
     except subprocess.CalledProcessError:
-        shell_script = subprocess.check_output(
+        shell_script = shaper.util.check_output(
             ["ssh-agent", "-t", "3d", "-a", agent_socket], text=True
         )
         info_file.write_text(shell_script)
@@ -35,12 +52,12 @@ def ssh_agent_info() -> dict:
 
 def ssh_ensure_agent_loaded() -> None:
     try:
-        subprocess.check_call(
+        shaper.util.check_call(
             ["ssh-add", "-l"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
         )
     except subprocess.CalledProcessError:
         os.environ.update(ssh_agent_info())
-        subprocess.check_call(["ssh-add"])
+        shaper.util.check_call(["ssh-add"])
 
 
 def dotfiles_ssh(
@@ -67,35 +84,148 @@ def dotfiles_ssh(
     dotfile_git("ssh", ["remote", "set-url", "origin", ssh_prefix + repo])
 
 
+def dotfile_git_command(module: str, command: list) -> list:
+    """Build a git command line for specified bare repo.
+
+    Args:
+        module: name of bare repo, such as base, or wayland
+        command: git subcommand and arguments, optionally preceded by options
+
+    Returns:
+        list with command and arguments
+    """
+    git_dir = DOTFILES / module
+    return ["git", f"--git-dir={git_dir}", f"--work-tree={HOME}", *command]
+
+
 def dotfile_git(module: str, command: list) -> None:
     """Run git command using specified bare repo.
 
     Args:
         module: name of bare repo, such as base, or wayland
     """
-    git_dir = DOTFILES / module
     DOTFILES.mkdir(parents=True, exist_ok=True)
-    module_git = ["git", f"--git-dir={git_dir}", f"--work-tree={HOME}", *command]
-    subprocess.check_call(module_git)
+    shaper.util.check_call(dotfile_git_command(module, command))
+
+
+def dotfile_drift(module: str, fsmonitor: bool = False) -> list:
+    """List tracked files that differ from the last commit of a bare repo.
+
+    Only tracked paths are checked, with the index preloaded in parallel,
+    so a large home directory is never scanned.
+
+    Args:
+        module: name of bare repo, such as base, or wayland
+        fsmonitor: ask the builtin file system monitor which paths changed
+
+    Returns:
+        porcelain status lines, such as " M .bashrc"
+    """
+    options = [
+        *STATUS_CONFIG,
+        "-c",
+        f"core.fsmonitor={str(fsmonitor).lower()}",
+        "status",
+        "--porcelain",
+        "-uno",
+        "--ignore-submodules",
+    ]
+    return list(shaper.util.iter_output(dotfile_git_command(module, options)))
+
+
+def dotfile_status(
+    modules: typing.Optional[typing.Iterable[str]] = None, fsmonitor: bool = False
+) -> dict:
+    """Check several bare repos for drift concurrently.
+
+    Args:
+        modules: names of bare repos, defaulting to all in ~/.dotfiles
+        fsmonitor: ask the builtin file system monitor which paths changed
+
+    Returns:
+        a dict of module name to status lines, or to an error message
+    """
+    if modules is None:
+        try:
+            modules = sorted(p.name for p in DOTFILES.iterdir() if p.is_dir())
+        except FileNotFoundError:
+            return {}
+    modules = list(modules)
+
+    def status(module: str) -> typing.Union[list, str]:
+        try:
+            return dotfile_drift(module, fsmonitor)
+        except (OSError, subprocess.CalledProcessError) as error:
+            return f"error: {error}"
+
+    with concurrent.futures.ThreadPoolExecutor(len(modules) or 1) as executor:
+        return dict(zip(modules, executor.map(status, modules)))
+
+
+def dotfile_mirror(url: str) -> pathlib.Path:
+    """Locate the local reference mirror for a dotfile repo.
+
+    Args:
+        url: repo URL
+
+    Returns:
+        path of the mirror, which may not exist yet
+    """
+    digest = hashlib.sha256(url.encode()).hexdigest()[:16]
+    name = url.rstrip("/").rsplit("/", 1)[-1].rsplit(":", 1)[-1]
+    return MIRRORS / f"{name}-{digest}"
 
 
-def dotfile_git_clone(module: str, url: str) -> None:
+def update_mirror(git_dir: pathlib.Path, url: str) -> None:
+    """Copy objects from a freshly cloned repo into its reference mirror.
+
+    This is a local operation, so later clones of the same URL only need to
+    fetch what changed since.
+
+    Args:
+        git_dir: cloned bare repo
+        url: repo URL the mirror is for
+    """
+    mirror = dotfile_mirror(url)
+    with mirror_lock:
+        if mirror.is_dir():
+            cmd = ["git", "-C", mirror, "fetch", "--quiet", git_dir, "+refs/*:refs/*"]
+        else:
+            MIRRORS.mkdir(parents=True, exist_ok=True)
+            cmd = ["git", "clone", "--quiet", "--mirror", git_dir, mirror]
+        shaper.util.check_call(cmd)
+
+
+def dotfile_git_clone(
+    module: str, url: str, partial: bool = False, depth: typing.Optional[int] = None
+) -> None:
     """Clone using specified bare git repo.
 
+    Objects already in the local reference mirror are copied rather than
+    fetched.
+
     Args:
         module: name of bare repo, such as base, or wayland
         url: repo URL
+        partial: fetch file contents lazily, on checkout
+        depth: if given, fetch only this many commits of history
     """
     git_dir = DOTFILES / module
     DOTFILES.mkdir(parents=True, exist_ok=True)
+    options = ["--reference-if-able", dotfile_mirror(url), "--dissociate"]
+    if partial:
+        options.append("--filter=blob:none")
+    if depth:
+        options.append(f"--depth={depth}")
     with tempfile.TemporaryDirectory(prefix="dtf-") as tmpdirname:
-        subprocess.check_call(
+        shaper.util.check_call(
             [
                 "git",
                 "clone",
                 "-c",
                 "status.showUntrackedFiles=no",
                 "-n",
+                *options,
                 "--separate-git-dir",
                 git_dir,
                 url,
@@ -104,17 +234,42 @@ def dotfile_git_clone(module: str, url: str) -> None:
         )
 
 
-def dotfile_git_restore(module: str, url: str, force: bool = False) -> None:
+def missing_dotfiles(module: str, url: str, force: bool = False) -> set:
+    """Determine if a dotfile bare repo has not been cloned.
+
+    Args:
+        module: name of bare repo, such as base, or wayland
+        url: repo URL
+        force: unused; accepted to match dotfile_git_restore
+
+    Returns:
+        a set containing module if it is missing
+    """
+    return set() if (DOTFILES / module).is_dir() else {module}
+
+
+def dotfile_git_restore(
+    module: str,
+    url: str,
+    force: bool = False,
+    partial: bool = False,
+    depth: typing.Optional[int] = None,
+) -> None:
     """Clone and restore using specified bare git repo.
 
+    Once checked out, a full clone also refreshes the local reference mirror.
+
     Args:
         module: name of bare repo, such as base, or wayland
         url: repo URL
+        force: overwrite conflicting files on checkout
+        partial: fetch file contents lazily, on checkout
+        depth: if given, fetch only this many commits of history
     """
     git_dir = DOTFILES / module
     if not git_dir.is_dir():
         try:
-            dotfile_git_clone(module, url)
+            dotfile_git_clone(module, url, partial, depth)
             cmd = ["checkout"]
             if force:
                 cmd.append("-f")
@@ -124,8 +279,72 @@ def dotfile_git_restore(module: str, url: str, force: bool = False) -> None:
                 "Deal with conflicting files, then run (possibly with -f "
                 f"flag if you are OK with overwriting)\ndtf {module} checkout"
             )
+            return
+        if not partial and not depth:
+            # Partial and shallow clones would leave the mirror incomplete
+            try:
+                update_mirror(git_dir, url)
+            except subprocess.CalledProcessError as error:
+                print(f"Could not refresh the mirror of {url}: {error}")
+
+
+def dotfile_git_restore_all(
+    modules: typing.Mapping[str, str],
+    force: bool = False,
+    partial: bool = False,
+    depth: typing.Optional[int] = None,
+) -> None:
+    """Clone and restore several bare git repos concurrently.
+
+    Args:
+        modules: a dict of bare repo name to repo URL
+        force: overwrite conflicting files on checkout
+        partial: fetch file contents lazily, on checkout
+        depth: if given, fetch only this many commits of history
+
+    Raises:
+        RuntimeError: if any module failed to clone
+    """
+    _, failures = shaper.util.run_batch(
+        lambda module: dotfile_git_restore(
+            module, modules[module], force, partial, depth
+        ),
+        modules,
+        len(modules) or 1,
+    )
+    if failures:
+        raise RuntimeError(f"{len(failures)} dotfile modules failed to restore")
+
+
+def print_status(report: dict) -> bool:
+    """Print a compact drift report.
+
+    Args:
+        report: as returned by dotfile_status
+
+    Returns:
+        True if every module is clean
+    """
+    clean = True
+    for module, lines in report.items():
+        if isinstance(lines, str):
+            print(f"{module}: {lines}")
+            clean = False
+        elif lines:
+            print(f"{module}: {len(lines)} changed")
+            for line in lines:
+                print(f"  {line}")
+            clean = False
+        else:
+            print(f"{module}: clean")
+    return clean
+
 
 if __name__ == "__main__":
     import sys
-    dotfile_git_restore(sys.argv[1], sys.argv[2], True)
 
+    if sys.argv[1:2] == ["status"]:
+        fsmonitor = "--fsmonitor" in sys.argv[2:]
+        modules = [a for a in sys.argv[2:] if a != "--fsmonitor"] or None
+        sys.exit(0 if print_status(dotfile_status(modules, fsmonitor)) else 1)
+    dotfile_git_restore(sys.argv[1], sys.argv[2], True)
@@ -1,14 +1,202 @@
 #!/usr/bin/env python3
 """Utility functions for downloading files."""
+import collections
 import hashlib
+import http.client
 import json
+import os
 import pathlib
+import shutil
 import subprocess
+import threading
+import time
 import typing
+import urllib.error
 import urllib.parse
 import urllib.request
 
+import shaper.util
+
 CHUNK_SIZE = 32768
+CACHE = shaper.util.CACHE_DIR / "downloads"
+INDEX = CACHE / "index.json"
+JSON_CACHE = shaper.util.CACHE_DIR / "json"
+JSON_TTL = 3600
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/101.0.4951.67 Safari/537.36"
+HASH_BUFFER = 1 << 20
+TAR_FILTERS = {
+    ".gz": ["-z"],
+    ".tgz": ["-z"],
+    ".bz2": ["-j"],
+    ".xz": ["-J"],
+    ".zst": ["--zstd"],
+}
+index_lock = threading.Lock()
+
+
+class ChecksumError(ValueError):
+    """Downloaded content does not match its expected digest."""
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections, shared across threads and keyed by host."""
+
+    def __init__(self, size: int = 8):
+        """Start with no connections.
+
+        Args:
+            size: maximum number of pooled connections per host
+        """
+        self.size = size
+        self.lock = threading.Lock()
+        self.connections: dict = {}
+
+    def acquire(self, key: tuple, factory: typing.Callable) -> list:
+        """Obtain a connection whose previous response has been read.
+
+        Args:
+            key: connection class and host
+            factory: callable creating a new connection
+
+        Returns:
+            a pool entry: a list of connection and its current response
+        """
+        with self.lock:
+            entries = self.connections.setdefault(key, [])
+            for entry in entries:
+                if entry[1] is None or entry[1] is not self and entry[1].isclosed():
+                    entry[1] = self
+                    return entry
+            entry = [factory(), self]
+            if len(entries) < self.size:
+                entries.append(entry)
+            return entry
+
+    def discard(self, key: tuple, entry: list) -> None:
+        """Close a connection and remove it from the pool.
+
+        Args:
+            key: connection class and host
+            entry: pool entry from acquire
+        """
+        entry[0].close()
+        with self.lock:
+            entries = self.connections.get(key, [])
+            if entry in entries:
+                entries.remove(entry)
+
+    def abandon(self, response: http.client.HTTPResponse) -> None:
+        """Close a response that will not be read to the end.
+
+        Its unread body would be mistaken for the next response on the same
+        connection, so the connection is closed and removed from the pool too.
+
+        Args:
+            response: response from a pooled connection
+        """
+        response.close()
+        with self.lock:
+            for key, entries in self.connections.items():
+                for entry in entries:
+                    if entry[1] is response:
+                        entry[0].close()
+                        entries.remove(entry)
+                        return
+
+
+pool = ConnectionPool()
+
+
+class PooledHandlerMixin:
+    """Open requests over pooled keep-alive connections."""
+
+    def pooled_open(
+        self, http_class: type, req: urllib.request.Request, **connection_args
+    ) -> http.client.HTTPResponse:
+        """Send a request, reusing an idle connection to the same host.
+
+        Mirrors urllib.request.AbstractHTTPHandler.do_open, without forcing
+        Connection: close. A reused connection that the server has since
+        closed is replaced and the request sent again.
+
+        Args:
+            http_class: HTTPConnection or HTTPSConnection
+            req: the request
+            connection_args: extra arguments for http_class
+
+        Returns:
+            the response
+
+        Raises:
+            URLError: if the request could not be sent
+        """
+        if not req.host:
+            raise urllib.error.URLError("no host given")
+        key = (http_class, req.host)
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers = {name.title(): value for name, value in headers.items()}
+        for attempt in range(2):
+            entry = pool.acquire(
+                key,
+                lambda: http_class(req.host, timeout=req.timeout, **connection_args),
+            )
+            connection = entry[0]
+            reused = connection.sock is not None
+            try:
+                connection.request(
+                    req.get_method(),
+                    req.selector,
+                    req.data,
+                    headers,
+                    encode_chunked=req.has_header("Transfer-encoding"),
+                )
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError) as error:
+                pool.discard(key, entry)
+                if reused and not attempt:
+                    continue
+                raise urllib.error.URLError(error)
+            except OSError as error:
+                pool.discard(key, entry)
+                raise urllib.error.URLError(error)
+            except Exception:
+                pool.discard(key, entry)
+                raise
+            entry[1] = response
+            response.url = req.get_full_url()
+            response.msg = response.reason
+            return response
+
+
+class PooledHTTPSHandler(PooledHandlerMixin, urllib.request.HTTPSHandler):
+    """HTTPS handler using the shared connection pool."""
+
+    def https_open(self, req: urllib.request.Request) -> http.client.HTTPResponse:
+        """Open an HTTPS request.
+
+        Args:
+            req: the request
+
+        Returns:
+            the response
+        """
+        return self.pooled_open(http.client.HTTPSConnection, req, context=self._context)
+
+
+class PooledHTTPHandler(PooledHandlerMixin, urllib.request.HTTPHandler):
+    """Plain HTTP handler using the shared connection pool, for local servers."""
+
+    def http_open(self, req: urllib.request.Request) -> http.client.HTTPResponse:
+        """Open an HTTP request.
+
+        Args:
+            req: the request
+
+        Returns:
+            the response
+        """
+        return self.pooled_open(http.client.HTTPConnection, req)
 
 
 class SafeOpener(urllib.request.OpenerDirector):
@@ -25,7 +213,7 @@ class SafeOpener(urllib.request.OpenerDirector):
             urllib.request.UnknownHandler,
             urllib.request.HTTPDefaultErrorHandler,
             urllib.request.HTTPRedirectHandler,
-            urllib.request.HTTPSHandler,
+            PooledHTTPSHandler,
             urllib.request.HTTPErrorProcessor,
         )
 
@@ -36,47 +224,556 @@ class SafeOpener(urllib.request.OpenerDirector):
 opener = SafeOpener()
 
 
-def json_get(url: str) -> typing.Union[dict, list, str]:
-    """Pull JSON data from a url.
+def json_get(
+    url: str, ttl: float = JSON_TTL, offline: typing.Optional[bool] = None
+) -> typing.Union[dict, list, str]:
+    """Pull JSON data from a url, through an on-disk cache.
+
+    Responses younger than ttl are served without a request. Older ones are
+    revalidated with ETag or Last-Modified, so an unchanged response costs a
+    304 (which GitHub does not count against its rate limit). If the
+    network fails, or in offline mode, stale responses are served.
 
     Args:
         url: URL of JSON response
+        ttl: seconds a cached response is used without revalidation
+        offline: serve only from the cache; defaults to True if the
+            SHAPER_OFFLINE environment variable is set
 
     Returns:
         JSON object
+
+    Raises:
+        FileNotFoundError: if offline and the response was never cached
     """
-    response = opener.open(url)
-    return json.load(response)
+    if offline is None:
+        offline = bool(os.environ.get("SHAPER_OFFLINE"))
+    path = JSON_CACHE / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+    try:
+        entry = json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        entry = None
+    if offline and entry is None:
+        raise FileNotFoundError(f"No cached response for {url} in offline mode")
+    if entry and (offline or time.time() - entry["fetched"] < ttl):
+        return entry["data"]
+
+    headers = {}
+    if entry and entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    try:
+        response = opener.open(urllib.request.Request(url, headers=headers))
+    except urllib.error.HTTPError as error:
+        if error.code != 304 and not entry:
+            raise
+        if error.code != 304:
+            print(f"Using stale response for {url}: {error}")
+            return entry["data"]
+    except OSError as error:
+        if not entry:
+            raise
+        print(f"Using stale response for {url}: {error}")
+        return entry["data"]
+    else:
+        entry = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "data": json.load(response),
+        }
+    entry["fetched"] = time.time()
+    shaper.util.write_json(path, entry)
+    return entry["data"]
 
 
-def download(url: str, destination: pathlib.Path) -> pathlib.Path:
-    """Copy data from a url to a local file.
+def make_request(
+    url: str, headers: typing.Optional[dict] = None
+) -> urllib.request.Request:
+    """Build a request with a browser-like User-Agent.
+
+    Args:
+        url: URL to request
+        headers: extra request headers
+
+    Returns:
+        the request
+    """
+    return urllib.request.Request(
+        url, headers={"User-Agent": USER_AGENT, **(headers or {})}
+    )
+
+
+def check_length(response: typing.Any, received: int) -> None:
+    """Make sure a response body was not cut short.
+
+    Args:
+        response: HTTP response
+        received: number of body bytes read
+
+    Raises:
+        ContentTooShortError: if fewer bytes than Content-Length were received
+    """
+    expected = response.headers.get("Content-Length")
+    if expected is not None and received < int(expected):
+        raise urllib.error.ContentTooShortError(
+            f"Received {received} of {expected} bytes from {response.url}", None
+        )
+
+
+def check_digests(actual: dict, expected: dict, url: str) -> None:
+    """Compare computed digests with expected ones.
+
+    Args:
+        actual: dict of algorithm to computed hexadecimal digest
+        expected: dict of algorithm to expected hexadecimal digest
+        url: URL of the content, for the error message
+
+    Raises:
+        ChecksumError: if any digest differs
+    """
+    for algorithm, value in expected.items():
+        if actual[algorithm] != value.lower():
+            raise ChecksumError(
+                f"{algorithm} mismatch for {url}: "
+                f"expected {value}, got {actual[algorithm]}"
+            )
+
+
+def read_index() -> dict:
+    """Load the download cache index.
+
+    Returns:
+        a dict of URL to cache entry
+    """
+    try:
+        return json.loads(INDEX.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def update_index(url: str, **fields) -> None:
+    """Update a download cache entry, removing content no longer referenced.
+
+    Args:
+        url: URL of cache entry
+        fields: entry fields to set, or to remove if None
+    """
+    with index_lock:
+        index = read_index()
+        entry = index.setdefault(url, {})
+        old_digest = entry.get("sha256")
+        entry.update(fields)
+        for key in [k for k, v in entry.items() if v is None]:
+            del entry[key]
+        shaper.util.write_json(INDEX, index)
+        referenced = {e.get("sha256") for e in index.values()}
+        if old_digest and old_digest not in referenced:
+            (CACHE / "objects" / old_digest).unlink(missing_ok=True)
+
+
+def request_headers(
+    entry: dict, cached: pathlib.Path, partial: pathlib.Path
+) -> typing.Tuple[dict, int]:
+    """Build conditional and resume headers for a cached URL.
+
+    Args:
+        entry: download cache index entry for the URL
+        cached: path of the cached content, which may not exist
+        partial: path of an interrupted transfer, which may not exist
+
+    Returns:
+        request headers, and the byte offset a Range request resumes from
+    """
+    headers = {}
+    if cached.is_file():
+        if "etag" in entry:
+            headers["If-None-Match"] = entry["etag"]
+        if "last_modified" in entry:
+            headers["If-Modified-Since"] = entry["last_modified"]
+    offset = partial.stat().st_size if partial.is_file() else 0
+    if offset and "partial_validator" in entry:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = entry["partial_validator"]
+    return headers, offset
+
+
+def verify_cached(
+    url: str, entry: dict, cached: pathlib.Path, digests: dict
+) -> pathlib.Path:
+    """Check unchanged cached content against expected digests.
+
+    Args:
+        url: URL of the content
+        entry: download cache index entry for the URL
+        cached: path of the cached content
+        digests: dict of hash algorithm to expected hexadecimal digest
+
+    Returns:
+        path of the cached content
+
+    Raises:
+        ChecksumError: if the content does not match; its entry is dropped
+    """
+    print(f"Not modified: {url}")
+    actual = {a: hashsum(cached, a) for a in digests if a != "sha256"}
+    try:
+        check_digests({**actual, "sha256": entry["sha256"]}, digests, url)
+    except ChecksumError:
+        update_index(url, sha256=None, etag=None, last_modified=None, size=None)
+        raise
+    update_index(url, fetched=time.time())
+    return cached
+
+
+def store_cached(
+    url: str, partial: pathlib.Path, sha256: str, response: typing.Any
+) -> pathlib.Path:
+    """Move a completed transfer into the cache and index it.
+
+    Args:
+        url: URL of the content
+        partial: path of the completed transfer
+        sha256: hexadecimal sha256 digest of the content
+        response: HTTP response the content came from
+
+    Returns:
+        path of the cached content
+    """
+    cached = CACHE / "objects" / sha256
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    partial.replace(cached)
+    update_index(
+        url,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        sha256=sha256,
+        size=cached.stat().st_size,
+        partial_validator=None,
+        fetched=time.time(),
+    )
+    return cached
+
+
+def fetch_cached(
+    url: str,
+    digests: typing.Optional[dict] = None,
+    progress: typing.Optional[typing.Callable[[int], None]] = None,
+    ttl: float = 0,
+) -> pathlib.Path:
+    """Bring the content of a URL into the download cache.
+
+    Unchanged content is revalidated with ETag or Last-Modified and not
+    downloaded again, and interrupted transfers resume with a Range request.
+    Digests are computed as the content streams to disk.
+
+    Args:
+        url: URL of file to be downloaded
+        digests: optional dict of hash algorithm to expected hexadecimal digest
+        progress: optional callable given the size of each chunk received
+        ttl: seconds cached content is used without revalidation
+
+    Returns:
+        path of the cached content
+
+    Raises:
+        ChecksumError: if the content does not match digests; it is discarded
+    """
+    digests = digests or {}
+    entry = read_index().get(url, {})
+    cached = CACHE / "objects" / entry.get("sha256", "-")
+    partial = CACHE / "partial" / hashlib.sha256(url.encode()).hexdigest()
+    if cached.is_file() and time.time() - entry.get("fetched", 0) < ttl:
+        return verify_cached(url, entry, cached, digests)
+    headers, offset = request_headers(entry, cached, partial)
+    try:
+        response = opener.open(make_request(url, headers))
+    except urllib.error.HTTPError as error:
+        if error.code == 304:
+            return verify_cached(url, entry, cached, digests)
+        if error.code == 416:
+            partial.unlink(missing_ok=True)
+            return fetch_cached(url, digests, progress, ttl)
+        raise
+
+    etag = response.headers.get("ETag")
+    strong_etag = etag if etag and not etag.startswith("W/") else None
+    update_index(
+        url, partial_validator=strong_etag or response.headers.get("Last-Modified")
+    )
+    hashes = {a: hashlib.new(a) for a in {"sha256", *digests}}
+    partial.parent.mkdir(parents=True, exist_ok=True)
+    if response.status == 206:
+        print(f"Resuming at byte {offset}")
+        with partial.open("rb") as partial_file:
+            while chunk := partial_file.read(HASH_BUFFER):
+                for hash in hashes.values():
+                    hash.update(chunk)
+        mode = "ab"
+    else:
+        mode = "wb"
+    with partial.open(mode) as partial_file:
+        while chunk := response.read(CHUNK_SIZE):
+            for hash in hashes.values():
+                hash.update(chunk)
+            partial_file.write(chunk)
+            if progress:
+                progress(len(chunk))
+    check_length(response, partial.stat().st_size - (offset if mode == "ab" else 0))
+    actual = {a: h.hexdigest() for a, h in hashes.items()}
+    try:
+        check_digests(actual, digests, url)
+    except ChecksumError:
+        partial.unlink()
+        update_index(url, partial_validator=None)
+        raise
+    return store_cached(url, partial, actual["sha256"], response)
+
+
+class Downloaded(typing.NamedTuple):
+    """A downloaded file and the sha256 digest computed as it arrived."""
+
+    path: pathlib.Path
+    sha256: str
+
+
+def download_with_digest(
+    url: str,
+    destination: pathlib.Path,
+    cache: bool = True,
+    digests: typing.Optional[dict] = None,
+    progress: typing.Optional[typing.Callable[[int], None]] = None,
+) -> Downloaded:
+    """Copy data from a url to a local file, reporting its sha256 digest.
 
     Args:
         url: URL of file to be downloaded
         destination: optional path of destination file
+        cache: keep a copy in the download cache and reuse it if unchanged
+        digests: optional dict of hash algorithm to expected hexadecimal digest,
+            such as {"sha256": "..."}, verified as the file downloads
+        progress: optional callable given the size of each chunk received
 
     Returns:
-        Downloaded file path
+        downloaded file path and hexadecimal sha256 digest
+
+    Raises:
+        ChecksumError: if the file does not match digests; it is deleted
     """
+    digests = digests or {}
     print(f"Requesting {url}")
     if destination.is_dir() or not destination.suffix:
         destination = destination.joinpath(
             urllib.parse.unquote(pathlib.PurePosixPath(url).name)
         )
-    request = urllib.request.Request(
-        url,
-        headers={
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/101.0.4951.67 Safari/537.36"
-        },
-    )
-    response = opener.open(request)
     destination.parent.mkdir(parents=True, exist_ok=True)
-    with destination.open("wb") as dest_file:
-        while chunk := response.read(CHUNK_SIZE):
-            dest_file.write(chunk)
+    if cache:
+        # Cached content is named by its sha256 digest
+        cached = fetch_cached(url, digests, progress)
+        shutil.copyfile(cached, destination)
+        sha256 = cached.name
+    else:
+        response = opener.open(make_request(url))
+        hashes = {a: hashlib.new(a) for a in {"sha256", *digests}}
+        with destination.open("wb") as dest_file:
+            while chunk := response.read(CHUNK_SIZE):
+                for hash in hashes.values():
+                    hash.update(chunk)
+                dest_file.write(chunk)
+                if progress:
+                    progress(len(chunk))
+        actual = {a: h.hexdigest() for a, h in hashes.items()}
+        try:
+            check_length(response, destination.stat().st_size)
+            check_digests(actual, digests, url)
+        except (ChecksumError, urllib.error.ContentTooShortError):
+            destination.unlink()
+            raise
+        sha256 = actual["sha256"]
     print(f"Downloaded {destination}")
-    return destination
+    return Downloaded(destination, sha256)
+
+
+def download(
+    url: str,
+    destination: pathlib.Path,
+    cache: bool = True,
+    digests: typing.Optional[dict] = None,
+    progress: typing.Optional[typing.Callable[[int], None]] = None,
+) -> pathlib.Path:
+    """Copy data from a url to a local file.
+
+    Args:
+        url: URL of file to be downloaded
+        destination: optional path of destination file
+        cache: keep a copy in the download cache and reuse it if unchanged
+        digests: optional dict of hash algorithm to expected hexadecimal digest,
+            such as {"sha256": "..."}, verified as the file downloads
+        progress: optional callable given the size of each chunk received
+
+    Returns:
+        Downloaded file path
+
+    Raises:
+        ChecksumError: if the file does not match digests; it is deleted
+    """
+    return download_with_digest(url, destination, cache, digests, progress).path
+
+
+class DownloadJob(typing.NamedTuple):
+    """A file to download, as submitted to download_all."""
+
+    url: str
+    destination: pathlib.Path
+    digests: typing.Optional[dict] = None
+
+
+class Progress:
+    """Aggregate progress and throughput of a batch of downloads."""
+
+    def __init__(self, total: int, interval: float = 2.0):
+        """Start counting.
+
+        Args:
+            total: number of files in the batch
+            interval: minimum seconds between progress reports
+        """
+        self.total = total
+        self.interval = interval
+        self.completed = 0
+        self.received = 0
+        self.lock = threading.Lock()
+        self.start = self.reported = time.monotonic()
+
+    def add(self, size: int) -> None:
+        """Count received bytes, reporting if the interval has passed.
+
+        Args:
+            size: number of bytes received
+        """
+        with self.lock:
+            self.received += size
+            now = time.monotonic()
+            if now - self.reported < self.interval:
+                return
+            self.reported = now
+        self.report()
+
+    def finish(self) -> None:
+        """Count a completed file."""
+        with self.lock:
+            self.completed += 1
+
+    def report(self) -> None:
+        """Print files completed, bytes received, and throughput."""
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        mebibytes = self.received / (1 << 20)
+        print(
+            f"Downloaded {self.completed}/{self.total} files, "
+            f"{mebibytes:.1f} MiB at {mebibytes / elapsed:.1f} MiB/s"
+        )
+
+
+def retryable(error: Exception) -> bool:
+    """Determine if a failed download is worth retrying.
+
+    Args:
+        error: exception raised by download
+
+    Returns:
+        True for network errors, server errors, and rate limiting
+    """
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code >= 500 or error.code in (408, 429)
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+
+async def download_batch(
+    jobs: typing.Iterable[DownloadJob],
+    concurrency: int = 8,
+    per_host: int = 4,
+    retries: int = 3,
+    backoff: float = 1.0,
+) -> typing.Tuple[dict, dict]:
+    """Download many files concurrently, within global and per-host limits.
+
+    Each download runs in a worker thread; failed ones are retried with
+    exponential backoff.
+
+    Args:
+        jobs: files to download
+        concurrency: maximum number of downloads at once
+        per_host: maximum number of downloads at once from one host
+        retries: number of times to retry a failed download
+        backoff: seconds to wait before the first retry, doubling after
+
+    Returns:
+        a dict of URL to Downloaded for successes, and of URL to exception
+        for failures
+    """
+    # Imported here, as asyncio is slow to import and rarely needed
+    import asyncio
+
+    jobs = list(jobs)
+    limit = asyncio.Semaphore(concurrency)
+    host_limits = collections.defaultdict(lambda: asyncio.Semaphore(per_host))
+    progress = Progress(len(jobs))
+    step = shaper.util.current_step()
+
+    async def fetch(job: DownloadJob) -> Downloaded:
+        host = urllib.parse.urlparse(job.url).hostname
+        async with host_limits[host], limit:
+            for attempt in range(retries + 1):
+                try:
+                    downloaded = await asyncio.to_thread(
+                        shaper.util.call_in_step,
+                        step,
+                        download_with_digest,
+                        job.url,
+                        job.destination,
+                        digests=job.digests,
+                        progress=progress.add,
+                    )
+                except Exception as error:
+                    if attempt == retries or not retryable(error):
+                        raise
+                    delay = backoff * 2**attempt
+                    print(f"Retrying {job.url} in {delay:.0f}s: {error}")
+                    await asyncio.sleep(delay)
+                else:
+                    progress.finish()
+                    return downloaded
+
+    outcomes = await asyncio.gather(*map(fetch, jobs), return_exceptions=True)
+    progress.report()
+    results = {}
+    failures = {}
+    for job, outcome in zip(jobs, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Failed {job.url}: {outcome}")
+            failures[job.url] = outcome
+        else:
+            results[job.url] = outcome
+    return results, failures
+
+
+def download_all(
+    jobs: typing.Iterable[DownloadJob], **kwargs
+) -> typing.Tuple[dict, dict]:
+    """Download many files concurrently; see download_batch.
+
+    Args:
+        jobs: files to download
+        kwargs: limits and retry settings for download_batch
+
+    Returns:
+        a dict of URL to Downloaded for successes, and of URL to exception
+        for failures
+    """
+    import asyncio
+
+    return asyncio.run(download_batch(jobs, **kwargs))
 
 
 def untar(
@@ -105,7 +802,119 @@ def untar(
         cmd.insert(0, "sudo")
     if overwrite:
         cmd.append("--recursive-unlink")
-    subprocess.check_call(cmd)
+    shaper.util.check_call(cmd)
+
+
+def swap_into_place(source: pathlib.Path, target: pathlib.Path, prefix: list) -> None:
+    """Replace target with source, leaving the old target at source.
+
+    The two are exchanged atomically with mv --exchange (coreutils 9.5 and
+    later). Otherwise target is moved aside first, and moved back if source
+    cannot take its place, so there is a moment when target is missing.
+
+    Args:
+        source: new file or directory
+        target: path to replace, which may not exist
+        prefix: command prefix, such as ["sudo"]
+
+    Raises:
+        CalledProcessError: if source could not be moved into place
+    """
+    if not (target.exists() or target.is_symlink()):
+        shaper.util.check_call([*prefix, "mv", "-T", source, target])
+        return
+    try:
+        shaper.util.check_call(
+            [*prefix, "mv", "--exchange", "-T", source, target],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return
+    except subprocess.CalledProcessError:
+        pass
+    replaced = source.with_name(f".replaced-{source.name}")
+    shaper.util.check_call([*prefix, "mv", "-T", target, replaced])
+    try:
+        shaper.util.check_call([*prefix, "mv", "-T", source, target])
+    except subprocess.CalledProcessError:
+        shaper.util.check_call([*prefix, "mv", "-T", replaced, target])
+        raise
+    shaper.util.check_call([*prefix, "mv", "-T", replaced, source])
+
+
+def install_tarball(
+    url: str,
+    destination: pathlib.Path,
+    digests: typing.Optional[dict] = None,
+    sudo: bool = False,
+) -> None:
+    """Stream a tarball from a url straight into GNU tar.
+
+    The archive is extracted into a staging directory inside destination
+    while it downloads and is hashed. Only once digests match are its
+    top-level entries moved into place with swap_into_place, replacing
+    existing ones.
+
+    Args:
+        url: URL of tar file
+        destination: directory to unpack into
+        digests: optional dict of hash algorithm to expected hexadecimal digest
+        sudo: will elevate if True
+
+    Raises:
+        CalledProcessError: if tar fails
+    """
+    print(f"Requesting {url}")
+    digests = digests or {}
+    prefix = ["sudo"] if sudo else []
+    staging = pathlib.Path(
+        shaper.util.check_output(
+            [*prefix, "mktemp", "-d", "-p", destination, ".shaper-XXXXXX"], text=True
+        ).strip()
+    )
+    try:
+        shaper.util.check_call([*prefix, "chmod", "755", staging])
+        response = opener.open(make_request(url))
+        hashes = {a: hashlib.new(a) for a in digests}
+        received = 0
+        suffix = pathlib.PurePosixPath(urllib.parse.urlparse(url).path).suffix
+        cmd = [*prefix, "tar", "-x", *TAR_FILTERS.get(suffix, []), "-C", staging]
+        cmd += ["-f", "-"]
+        with shaper.util.popen(cmd, stdin=subprocess.PIPE) as tar:
+            try:
+                while chunk := response.read(CHUNK_SIZE):
+                    for hash in hashes.values():
+                        hash.update(chunk)
+                    tar.stdin.write(chunk)
+                    received += len(chunk)
+                tar.stdin.close()
+            except BrokenPipeError:
+                pool.abandon(response)
+        if tar.returncode:
+            raise subprocess.CalledProcessError(tar.returncode, cmd)
+        check_length(response, received)
+        check_digests({a: h.hexdigest() for a, h in hashes.items()}, digests, url)
+        for name in sorted(p.name for p in staging.iterdir()):
+            swap_into_place(staging / name, destination / name, prefix)
+        print(f"Installed {url} into {destination}")
+    finally:
+        shaper.util.check_call([*prefix, "rm", "-rf", staging])
+
+
+def missing_remote_script(
+    command: str, url: str, extra: typing.Iterable = ()
+) -> set:
+    """Determine if a command installed by remote script is missing.
+
+    Args:
+        command: command to try to determine existence
+        url: download URL for installation script
+        extra: list of extra arguments to pass to script
+
+    Returns:
+        a set containing command if it is not on PATH
+    """
+    return set() if shutil.which(command) else {command}
 
 
 def install_with_remote_script(
@@ -119,12 +928,12 @@ def install_with_remote_script(
         extra: list of extra arguments to pass to script
     """
     try:
-        subprocess.check_call(["command", "-v", command])
+        shaper.util.check_call(["command", "-v", command])
     except subprocess.CalledProcessError:
         print(f"Requesting {url}")
         response = opener.open(url)
         script = response.read()
-        subprocess.check_call(["/bin/bash", "-c", script, "--", *extra])
+        shaper.util.check_call(["/bin/bash", "-c", script, "--", *extra])
 
 
 def hashsum(filepath: pathlib.Path, algorithm: str = "sha256") -> str:
@@ -138,9 +947,11 @@ def hashsum(filepath: pathlib.Path, algorithm: str = "sha256") -> str:
         hexadecimal hash string
     """
     hash = hashlib.new(algorithm)
-    with filepath.open("rb") as file_handle:
-        while chunk := file_handle.read(CHUNK_SIZE):
-            hash.update(chunk)
+    buffer = bytearray(HASH_BUFFER)
+    view = memoryview(buffer)
+    with filepath.open("rb", buffering=0) as file_handle:
+        while size := file_handle.readinto(buffer):
+            hash.update(view[:size])
     return hash.hexdigest()
 
 
@@ -1,21 +1,50 @@
 import base64
+import io
+import json
+import os
+import pathlib
+import struct
+import tempfile
+import typing
 
-from nacl import pwhash
-from nacl import secret
-from nacl import utils
+if typing.TYPE_CHECKING:
+    from nacl import secret
 
-OPS = pwhash.argon2i.OPSLIMIT_MODERATE
-MEM = pwhash.argon2i.MEMLIMIT_MODERATE
-kdf = pwhash.argon2i.kdf
 
+def __getattr__(name: str) -> typing.Any:
+    from nacl import pwhash
 
-def encrypt(password: str, plaintext: str) -> bytes:
-    salt = utils.random(pwhash.argon2i.SALTBYTES)
+    lazy = {
+        "OPS": pwhash.argon2i.OPSLIMIT_MODERATE,
+        "MEM": pwhash.argon2i.MEMLIMIT_MODERATE,
+        "kdf": pwhash.argon2i.kdf,
+    }
+    if name in lazy:
+        return lazy[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def secret_box(password: str, salt: bytes) -> "secret.SecretBox":
+    from nacl import pwhash
+    from nacl import secret
 
-    key = kdf(
-        secret.SecretBox.KEY_SIZE, password.encode(), salt, opslimit=OPS, memlimit=MEM
+    key = pwhash.argon2i.kdf(
+        secret.SecretBox.KEY_SIZE,
+        password.encode(),
+        salt,
+        opslimit=pwhash.argon2i.OPSLIMIT_MODERATE,
+        memlimit=pwhash.argon2i.MEMLIMIT_MODERATE,
     )
-    box = secret.SecretBox(key)
+    return secret.SecretBox(key)
+
+
+def encrypt(password: str, plaintext: str) -> bytes:
+    from nacl import pwhash
+    from nacl import secret
+    from nacl import utils
+
+    salt = utils.random(pwhash.argon2i.SALTBYTES)
+    box = secret_box(password, salt)
     nonce = utils.random(secret.SecretBox.NONCE_SIZE)
 
     ciphertext = box.encrypt(plaintext.encode(), nonce)
@@ -23,14 +52,529 @@ def encrypt(password: str, plaintext: str) -> bytes:
 
 
 def decrypt(password: str, ciphertext: bytes) -> str:
+    from nacl import pwhash
+
     payload = base64.b64decode(ciphertext)
     salt, cipherbytes = (
         payload[: pwhash.argon2i.SALTBYTES],
         payload[pwhash.argon2i.SALTBYTES :],
     )
-    key = kdf(
-        secret.SecretBox.KEY_SIZE, password.encode(), salt, opslimit=OPS, memlimit=MEM
-    )
-    box = secret.SecretBox(key)
+    box = secret_box(password, salt)
     received = box.decrypt(cipherbytes)
     return received.decode()
+
+
+VAULT_VERSION = 1
+CHECK = b"shaper vault"
+
+
+def check_kdf_limits(ops: int, mem: int) -> None:
+    """Refuse key derivation costs above what libsodium calls sensitive.
+
+    Args:
+        ops: argon2i operations limit
+        mem: argon2i memory limit in bytes
+
+    Raises:
+        ValueError: if either limit is too high
+    """
+    from nacl import pwhash
+
+    argon2i = pwhash.argon2i
+    if ops > argon2i.OPSLIMIT_SENSITIVE or mem > argon2i.MEMLIMIT_SENSITIVE:
+        raise ValueError("Key derivation limits are too high")
+
+
+class Keyring:
+    """Named secrets sealed with one key, derived once from a password."""
+
+    def __init__(self, key: bytes, vault: dict):
+        """Use a derived key for a vault.
+
+        Args:
+            key: SecretBox key
+            vault: vault dict, as returned by load_vault
+        """
+        from nacl import secret
+
+        self.key = key
+        self.box = secret.SecretBox(key)
+        self.vault = vault
+
+    @classmethod
+    def unlock(cls, password: str, vault: typing.Optional[dict] = None) -> "Keyring":
+        """Derive the key for a vault, creating the vault if there is none.
+
+        Args:
+            password: vault password
+            vault: vault dict, as returned by load_vault, or None for a new one
+
+        Returns:
+            a keyring for the vault
+
+        Raises:
+            ValueError: if the vault asks for excessive key derivation limits
+            nacl.exceptions.CryptoError: if the password is wrong
+        """
+        from nacl import pwhash
+        from nacl import secret
+        from nacl import utils
+
+        if vault is None:
+            salt = utils.random(pwhash.argon2i.SALTBYTES)
+            vault = {
+                "version": VAULT_VERSION,
+                "salt": base64.b64encode(salt).decode(),
+                "opslimit": pwhash.argon2i.OPSLIMIT_MODERATE,
+                "memlimit": pwhash.argon2i.MEMLIMIT_MODERATE,
+                "secrets": {},
+            }
+        check_kdf_limits(vault["opslimit"], vault["memlimit"])
+        key = pwhash.argon2i.kdf(
+            secret.SecretBox.KEY_SIZE,
+            password.encode(),
+            base64.b64decode(vault["salt"]),
+            opslimit=vault["opslimit"],
+            memlimit=vault["memlimit"],
+        )
+        keyring = cls(key, vault)
+        if "check" in vault:
+            keyring.open(vault["check"])
+        else:
+            vault["check"] = keyring.seal(CHECK).decode()
+        return keyring
+
+    def seal(self, plaintext: bytes) -> bytes:
+        """Encrypt bytes with a random nonce.
+
+        Args:
+            plaintext: bytes to encrypt
+
+        Returns:
+            base64-encoded nonce and ciphertext
+        """
+        return base64.b64encode(self.box.encrypt(plaintext))
+
+    def open(self, ciphertext: typing.Union[str, bytes]) -> bytes:
+        """Decrypt bytes sealed with this keyring.
+
+        Args:
+            ciphertext: base64-encoded nonce and ciphertext
+
+        Returns:
+            decrypted bytes
+
+        Raises:
+            nacl.exceptions.CryptoError: if the ciphertext was not sealed with this key
+        """
+        return self.box.decrypt(base64.b64decode(ciphertext))
+
+    def __contains__(self, name: str) -> bool:
+        """Determine if the vault holds a secret.
+
+        Args:
+            name: secret name
+
+        Returns:
+            True if the secret exists
+        """
+        return name in self.vault["secrets"]
+
+    def __getitem__(self, name: str) -> str:
+        """Decrypt a secret.
+
+        Args:
+            name: secret name
+
+        Returns:
+            the secret
+
+        Raises:
+            ValueError: if the secret was sealed under another name
+        """
+        # Each secret is sealed with its name, so swapped entries are detected
+        prefix = name.encode() + b"\0"
+        sealed = self.open(self.vault["secrets"][name])
+        if not sealed.startswith(prefix):
+            raise ValueError(f"Secret {name!r} was sealed under another name")
+        return sealed[len(prefix) :].decode()
+
+    def __setitem__(self, name: str, plaintext: str) -> None:
+        """Encrypt a secret, replacing any with the same name.
+
+        Args:
+            name: secret name
+            plaintext: the secret
+
+        Raises:
+            ValueError: if the name contains NUL
+        """
+        if "\0" in name:
+            raise ValueError("Secret names cannot contain NUL")
+        sealed = self.seal(name.encode() + b"\0" + plaintext.encode())
+        self.vault["secrets"][name] = sealed.decode()
+
+    def __delitem__(self, name: str) -> None:
+        """Remove a secret.
+
+        Args:
+            name: secret name
+        """
+        del self.vault["secrets"][name]
+
+    def names(self) -> list:
+        """List the names of all secrets.
+
+        Returns:
+            sorted list of names
+        """
+        return sorted(self.vault["secrets"])
+
+    def encrypt_all(self, secrets: typing.Mapping[str, str]) -> None:
+        """Encrypt several secrets.
+
+        Args:
+            secrets: a dict of name to secret
+        """
+        for name, plaintext in secrets.items():
+            self[name] = plaintext
+
+    def decrypt_all(self, names: typing.Optional[typing.Iterable] = None) -> dict:
+        """Decrypt several secrets with no further key derivation.
+
+        Args:
+            names: names of secrets, defaulting to all
+
+        Returns:
+            a dict of name to secret
+        """
+        return {name: self[name] for name in (self.names() if names is None else names)}
+
+
+def load_vault(path: typing.Union[str, pathlib.Path]) -> typing.Optional[dict]:
+    """Read a vault file.
+
+    Args:
+        path: vault file
+
+    Returns:
+        vault dict, or None if the file does not exist
+
+    Raises:
+        ValueError: if the vault has an unsupported version
+    """
+    try:
+        vault = json.loads(pathlib.Path(path).read_text())
+    except FileNotFoundError:
+        return None
+    if vault.get("version") != VAULT_VERSION:
+        raise ValueError(f"Unsupported vault version {vault.get('version')}")
+    return vault
+
+
+def save_vault(path: typing.Union[str, pathlib.Path], keyring: Keyring) -> None:
+    """Write a vault file atomically, readable only by its owner.
+
+    Args:
+        path: vault file
+        keyring: keyring holding the vault
+    """
+    path = pathlib.Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # mkstemp creates a new file readable only by its owner
+    descriptor, temporary = tempfile.mkstemp(prefix=f".{path.name}.", dir=path.parent)
+    try:
+        with os.fdopen(descriptor, "w") as writer:
+            json.dump(keyring.vault, writer, indent=2, sort_keys=True)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    os.replace(temporary, path)
+
+
+def unlock_vault(password: str, path: typing.Union[str, pathlib.Path]) -> Keyring:
+    """Unlock a vault file, or start a new vault if it does not exist.
+
+    Args:
+        password: vault password
+        path: vault file
+
+    Returns:
+        a keyring for the vault
+    """
+    return Keyring.unlock(password, load_vault(path))
+
+
+STREAM_MAGIC = b"SHAPERSS"
+STREAM_VERSION = 1
+STREAM_CHUNK = 1 << 16
+KEYRING_STREAM = 0
+PASSWORD_STREAM = 1
+LIMITS = struct.Struct(">QQ")
+LENGTH = struct.Struct(">I")
+
+
+def stream_preamble(secret: typing.Union[str, Keyring]) -> typing.Tuple[bytes, bytes]:
+    """Choose the key for a new stream and the preamble that identifies it.
+
+    Args:
+        secret: keyring, or password to derive a key from with a fresh salt
+
+    Returns:
+        key and preamble, which for a password holds the salt and limits
+    """
+    from nacl import pwhash
+    from nacl import utils
+
+    if isinstance(secret, Keyring):
+        return secret.key, STREAM_MAGIC + bytes([STREAM_VERSION, KEYRING_STREAM])
+    salt = utils.random(pwhash.argon2i.SALTBYTES)
+    ops, mem = pwhash.argon2i.OPSLIMIT_MODERATE, pwhash.argon2i.MEMLIMIT_MODERATE
+    key = pwhash.argon2i.kdf(32, secret.encode(), salt, opslimit=ops, memlimit=mem)
+    preamble = STREAM_MAGIC + bytes([STREAM_VERSION, PASSWORD_STREAM])
+    return key, preamble + salt + LIMITS.pack(ops, mem)
+
+
+def read_exact(source: typing.BinaryIO, size: int) -> bytes:
+    """Read exactly a number of bytes.
+
+    Args:
+        source: file to read from
+        size: number of bytes
+
+    Returns:
+        the bytes read
+
+    Raises:
+        ValueError: if the stream ends first
+    """
+    data = source.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated encrypted stream")
+    return data
+
+
+def read_preamble(
+    secret: typing.Union[str, Keyring], source: typing.BinaryIO, magic: bytes
+) -> typing.Tuple[bytes, bytes, bytes]:
+    """Read and check a stream preamble and secretstream header.
+
+    Args:
+        secret: keyring or password the stream was encrypted with
+        source: file positioned after the magic bytes
+        magic: magic bytes already read
+
+    Returns:
+        key, the full preamble, and the secretstream header
+
+    Raises:
+        ValueError: if the stream is not ours, or needs the other kind of secret
+    """
+    from nacl import bindings
+    from nacl import pwhash
+
+    preamble = magic + read_exact(source, 2)
+    if preamble[:-2] != STREAM_MAGIC or preamble[-2] != STREAM_VERSION:
+        raise ValueError("Not a shaper encrypted stream")
+    if preamble[-1] == KEYRING_STREAM:
+        if not isinstance(secret, Keyring):
+            raise ValueError("Stream was encrypted with a keyring, not a password")
+        key = secret.key
+    else:
+        if isinstance(secret, Keyring):
+            raise ValueError("Stream was encrypted with a password, not a keyring")
+        salt = read_exact(source, pwhash.argon2i.SALTBYTES)
+        limits = read_exact(source, LIMITS.size)
+        ops, mem = LIMITS.unpack(limits)
+        check_kdf_limits(ops, mem)
+        key = pwhash.argon2i.kdf(32, secret.encode(), salt, opslimit=ops, memlimit=mem)
+        preamble += salt + limits
+    header = read_exact(
+        source, bindings.crypto_secretstream_xchacha20poly1305_HEADERBYTES
+    )
+    return key, preamble, header
+
+
+def encrypt_stream(
+    secret: typing.Union[str, Keyring],
+    source: typing.BinaryIO,
+    destination: typing.BinaryIO,
+    binary: bool = False,
+    chunk_size: int = STREAM_CHUNK,
+) -> None:
+    """Encrypt a file object in chunks, never holding all of it in memory.
+
+    Args:
+        secret: keyring, or password to derive a key from
+        source: plaintext to read
+        destination: file to write the encrypted stream to
+        binary: write length-prefixed records instead of base64 lines
+        chunk_size: bytes of plaintext per record
+
+    Raises:
+        ValueError: if chunk_size is out of range
+    """
+    from nacl import bindings
+
+    if not 0 < chunk_size <= STREAM_CHUNK:
+        raise ValueError(f"Chunk size must be between 1 and {STREAM_CHUNK}")
+    key, preamble = stream_preamble(secret)
+    state = bindings.crypto_secretstream_xchacha20poly1305_state()
+    header = bindings.crypto_secretstream_xchacha20poly1305_init_push(state, key)
+    if binary:
+        destination.write(preamble + header)
+    else:
+        destination.write(base64.b64encode(preamble + header) + b"\n")
+    # The preamble is authenticated along with the first chunk
+    associated = preamble
+    chunk = source.read(chunk_size)
+    while True:
+        following = source.read(chunk_size)
+        tag = (
+            bindings.crypto_secretstream_xchacha20poly1305_TAG_MESSAGE
+            if following
+            else bindings.crypto_secretstream_xchacha20poly1305_TAG_FINAL
+        )
+        record = bindings.crypto_secretstream_xchacha20poly1305_push(
+            state, chunk, associated, tag
+        )
+        if binary:
+            destination.write(LENGTH.pack(len(record)) + record)
+        else:
+            destination.write(base64.b64encode(record) + b"\n")
+        if not following:
+            return
+        associated = None
+        chunk = following
+
+
+def decrypt_stream(
+    secret: typing.Union[str, Keyring],
+    source: typing.BinaryIO,
+    destination: typing.BinaryIO,
+) -> None:
+    """Decrypt a stream written by encrypt_stream, in either format.
+
+    Args:
+        secret: keyring or password the stream was encrypted with
+        source: encrypted stream to read
+        destination: file to write plaintext to
+
+    Raises:
+        ValueError: if the stream is malformed, truncated, or followed by data
+        nacl.exceptions.CryptoError: if a record fails to authenticate
+    """
+    from nacl import bindings
+
+    magic = source.read(len(STREAM_MAGIC))
+    binary = magic == STREAM_MAGIC
+    if binary:
+        reader = source
+    else:
+        reader = io.BytesIO(base64.b64decode(magic + source.readline()))
+        magic = reader.read(len(STREAM_MAGIC))
+    key, associated, header = read_preamble(secret, reader, magic)
+    state = bindings.crypto_secretstream_xchacha20poly1305_state()
+    bindings.crypto_secretstream_xchacha20poly1305_init_pull(state, header, key)
+    final = bindings.crypto_secretstream_xchacha20poly1305_TAG_FINAL
+    longest = STREAM_CHUNK + bindings.crypto_secretstream_xchacha20poly1305_ABYTES
+    # Base64 line of the longest record, with its newline
+    line_limit = 4 * -(-longest // 3) + 1
+    while True:
+        if binary:
+            (length,) = LENGTH.unpack(read_exact(source, LENGTH.size))
+            if length > longest:
+                raise ValueError("Encrypted stream record is too long")
+            record = read_exact(source, length)
+        else:
+            line = source.readline(line_limit)
+            if not line:
+                raise ValueError("Truncated encrypted stream")
+            if len(line) == line_limit and not line.endswith(b"\n"):
+                raise ValueError("Encrypted stream record is too long")
+            record = base64.b64decode(line)
+        message, tag = bindings.crypto_secretstream_xchacha20poly1305_pull(
+            state, record, associated
+        )
+        destination.write(message)
+        if tag == final:
+            break
+        associated = None
+    if source.read(1):
+        raise ValueError("Trailing data after encrypted stream")
+
+
+def private_file(path: pathlib.Path) -> typing.BinaryIO:
+    """Open a file for writing, readable only by its owner.
+
+    Args:
+        path: file to create or truncate
+
+    Returns:
+        binary file object
+    """
+    flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+    return open(os.open(path, flags, 0o600), "wb")
+
+
+def transform_file(
+    function: typing.Callable,
+    source: typing.Union[str, pathlib.Path],
+    destination: typing.Union[str, pathlib.Path],
+) -> None:
+    """Write a function's output to a private file, replacing it atomically.
+
+    Args:
+        function: called with a reader for source and a writer
+        source: file to read
+        destination: file to replace; left untouched if function fails
+    """
+    destination = pathlib.Path(destination)
+    temporary = destination.with_name(f".{destination.name}.{os.getpid()}")
+    try:
+        with open(source, "rb") as reader, private_file(temporary) as writer:
+            function(reader, writer)
+    except BaseException:
+        temporary.unlink(missing_ok=True)
+        raise
+    temporary.replace(destination)
+
+
+def encrypt_file(
+    secret: typing.Union[str, Keyring],
+    source: typing.Union[str, pathlib.Path],
+    destination: typing.Union[str, pathlib.Path],
+    binary: bool = False,
+) -> None:
+    """Encrypt a file.
+
+    Args:
+        secret: keyring, or password to derive a key from
+        source: plaintext file
+        destination: encrypted file to write
+        binary: write length-prefixed records instead of base64 lines
+    """
+    transform_file(
+        lambda reader, writer: encrypt_stream(secret, reader, writer, binary),
+        source,
+        destination,
+    )
+
+
+def decrypt_file(
+    secret: typing.Union[str, Keyring],
+    source: typing.Union[str, pathlib.Path],
+    destination: typing.Union[str, pathlib.Path],
+) -> None:
+    """Decrypt a file written by encrypt_file.
+
+    Args:
+        secret: keyring or password the file was encrypted with
+        source: encrypted file
+        destination: plaintext file to write
+    """
+    transform_file(
+        lambda reader, writer: decrypt_stream(secret, reader, writer),
+        source,
+        destination,
+    )
@@ -1,6 +1,6 @@
 """Utility functions for managing fonts."""
+import json
 import pathlib
-import subprocess
 import urllib.parse
 
 import shaper.download
@@ -8,37 +8,100 @@ import shaper.util
 
 
 HOME = pathlib.Path.home()
+FONTS = HOME / ".local/share/fonts"
+MANIFEST = FONTS / "shaper-fonts.json"
 
 
+def font_filename(url: str) -> str:
+    """Determine local file name for a font URL.
+
+    Args:
+        url: URL of font
+
+    Returns:
+        file name, as shaper.download.download would save it
+    """
+    return urllib.parse.unquote(pathlib.PurePosixPath(url).name)
+
+
+def read_manifest() -> dict:
+    """Load the manifest of fonts installed by shaper.
+
+    Returns:
+        a dict of URL to a dict with filename and sha256
+    """
+    try:
+        return json.loads(MANIFEST.read_text())
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(manifest: dict) -> None:
+    """Save the manifest of fonts installed by shaper.
+
+    Args:
+        manifest: a dict of URL to a dict with filename and sha256
+    """
+    MANIFEST.parent.mkdir(parents=True, exist_ok=True)
+    MANIFEST.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+
+
+@shaper.util.inventory_cache("fonts", lambda: [FONTS, MANIFEST])
 def existing_fonts() -> set:
-    """Obtain list of currently installed fonts.
+    """Obtain list of fonts installed from URLs.
 
     Returns:
-        a set of font names
+        a set of font URLs
     """
-    command = ["fc-list", "-f", "%{fullname[0]}\n"]
-    fonts = shaper.util.get_set_from_output(command)
-    fonts.remove("")
-    return fonts
+    return {
+        url
+        for url, font in read_manifest().items()
+        if (FONTS / font["filename"]).is_file()
+    }
 
 
-def install_font(url: str) -> None:
-    """Download and install font from URL.
+def missing_fonts(filename: str) -> set:
+    """Determine which font URLs listed in file are not installed.
 
     Args:
-        url: URL of font to be downloaded
+        filename: path to text file listing font URLs
+
+    Returns:
+        a set of font URLs
     """
-    shaper.download.download(url, HOME / ".local/share/fonts")
+    return shaper.util.get_set_from_file(filename) - {""} - existing_fonts()
+
 
+def install_fonts(filename: str, concurrency: int = shaper.util.JOBS) -> None:
+    """Install font URLs from file, downloading several at once.
 
-def install_fonts(filename: str) -> None:
-    """Install font URLs from file."""
-    possible_fonts = {
-        urllib.parse.unquote(pathlib.Path(f).stem): f
-        for f in shaper.util.get_set_from_file(filename)
+    Args:
+        filename: path to text file listing font URLs
+        concurrency: maximum number of concurrent downloads
+
+    Raises:
+        RuntimeError: if any font failed to download
+    """
+    manifest = read_manifest()
+    to_install = missing_fonts(filename)
+    for url in list(to_install):
+        path = FONTS / font_filename(url)
+        if path.is_file():
+            # Installed before the manifest existed
+            manifest[url] = {
+                "filename": path.name,
+                "sha256": shaper.download.hashsum(path),
+            }
+            to_install.remove(url)
+    jobs = [shaper.download.DownloadJob(url, FONTS) for url in to_install]
+    downloaded, failures = shaper.download.download_all(jobs, concurrency=concurrency)
+    installed = {
+        url: {"filename": font.path.name, "sha256": font.sha256}
+        for url, font in downloaded.items()
     }
-    to_install = set(possible_fonts) - existing_fonts()
-    for font in to_install:
-        install_font(possible_fonts[font])
-    if to_install:
-        subprocess.check_call(["fc-cache", "-f"])
+    manifest.update(installed)
+    write_manifest(manifest)
+    if installed:
+        shaper.util.check_call(["fc-cache", FONTS])
+    if failures:
+        raise RuntimeError(f"{len(failures)} fonts failed to install")
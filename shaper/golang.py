@@ -1,7 +1,8 @@
 """Utility functions for managing local Go packages."""
+import os
 import platform
 import subprocess
-import tempfile
+import typing
 from pathlib import Path
 
 import shaper.download
@@ -17,13 +18,36 @@ ARCHES = {
     "i686": "386",
     "armv7l": "armv6l",
 }
+JOBS = os.cpu_count() or 1
+BUILD_MEMORY = 1 << 30
 
 
-def go_update() -> None:
+def current_go_version() -> str:
+    """Obtain version of the installed Go toolchain.
+
+    Returns:
+        version, such as "go1.21.6", or empty string if not installed
+    """
     try:
-        current_version = subprocess.check_output([GOEXE, "version"], text=True).split()[2]
+        return shaper.util.check_output([GOEXE, "version"], text=True).split()[2]
     except FileNotFoundError:
-        current_version = ""
+        return ""
+
+
+def missing_go() -> set:
+    """Determine if the Go toolchain is out of date.
+
+    Returns:
+        a set containing the latest version if it is not installed
+    """
+    latest_version = shaper.download.json_get("https://go.dev/dl/?mode=json")[0][
+        "version"
+    ]
+    return {latest_version} - {current_go_version()}
+
+
+def go_update() -> None:
+    current_version = current_go_version()
 
     latest_go: dict = shaper.download.json_get("https://go.dev/dl/?mode=json")[0]
     latest_version = latest_go["version"]
@@ -39,31 +63,33 @@ def go_update() -> None:
         filename = downloads[arch][0]
         sha256sum = downloads[arch][1]
 
-        with tempfile.TemporaryDirectory(prefix="golang-") as tmpdirname:
-            tmpdir = Path(tmpdirname)
-            downloaded_file = shaper.download.download(
-                f"https://go.dev/dl/{filename}", tmpdir
+        try:
+            shaper.download.install_tarball(
+                f"https://go.dev/dl/{filename}",
+                GOROOT.parent,
+                digests={"sha256": sha256sum},
+                sudo=True,
             )
-            checksum = shaper.download.hashsum(downloaded_file)
-            if checksum == sha256sum:
-                subprocess.check_call(
-                    [
-                        "sudo",
-                        "tar",
-                        "-x",
-                        "-C",
-                        GOROOT.parent,
-                        "--recursive-unlink",
-                        "-f",
-                        tmpdir / filename,
-                    ]
-                )
-            else:
-                print(f"Checksum failure for {filename}")
-                print(sha256sum)
-                print(checksum)
+        except shaper.download.ChecksumError as error:
+            print(f"Checksum failure for {filename}")
+            print(error)
+
+
+def package_path(line: str) -> typing.Optional[str]:
+    """Extract the package path from a line of `go version -m` output.
+
+    Args:
+        line: line of output
 
+    Returns:
+        package path, or None for other lines
+    """
+    if line.startswith("\tpath\t"):
+        return line[len("\tpath\t") :].strip()
+    return None
 
+
+@shaper.util.inventory_cache("go", lambda: [GOPATH])
 def existing_go() -> set:
     """Obtain list of installed Go packages.
 
@@ -72,29 +98,76 @@ def existing_go() -> set:
     """
     cmd = [GOEXE, "version", "-m", GOPATH]
     try:
-        packages = shaper.util.get_set_from_output(cmd)
+        return shaper.util.get_set_from_output(cmd, package_path)
     except (FileNotFoundError, subprocess.CalledProcessError):
-        packages = set()
-    return {
-        line.replace("\tpath\t", "").strip()
-        for line in packages
-        if line.startswith("\tpath")
-    }
+        return set()
 
 
-def install_go_packages(filename: str) -> None:
-    """Install Go packages from text file.
+def prefetch_go_package(package: str) -> None:
+    """Download modules needed by a Go package into the shared module cache.
+
+    Args:
+        package: Go package path
+    """
+    cmd = [GOEXE, "install", "-n", f"{package}@latest"]
+    shaper.util.check_output(cmd, stderr=subprocess.DEVNULL)
+
+
+def install_go_package(package: str, build_jobs: int = JOBS) -> None:
+    """Build and install a Go package.
+
+    Args:
+        package: Go package path
+        build_jobs: number of parallel compile jobs within this build
+    """
+    cmd = [GOEXE, "install", "-p", str(build_jobs), f"{package}@latest"]
+    shaper.util.check_call(cmd)
+
+
+def missing_go_packages(filename: str) -> set:
+    """Determine which Go packages listed in file are not installed.
 
     Args:
         filename: path to text file listing packages
+
+    Returns:
+        a set of package paths
     """
-    existing = existing_go()
-    to_install = shaper.util.get_set_from_file(filename)
-    new_packages = to_install - existing
+    return shaper.util.get_set_from_file(filename) - existing_go() - {""}
+
+
+def install_go_packages(
+    filename: str,
+    jobs: int = JOBS,
+    memory_per_job: int = BUILD_MEMORY,
+    prefetch: bool = True,
+) -> None:
+    """Install Go packages from text file, building several at once.
+
+    Modules for all packages are downloaded first, with network-bound
+    concurrency, so builds do not wait on the network.
 
-    for package in new_packages:
-        cmd = [GOEXE, "install", f"{package}@latest"]
-        subprocess.check_call(cmd)
+    Args:
+        filename: path to text file listing packages
+        jobs: maximum number of concurrent builds
+        memory_per_job: expected peak memory of one build in bytes
+        prefetch: download all modules before building if True
+
+    Raises:
+        RuntimeError: if any package failed to install
+    """
+    new_packages = missing_go_packages(filename)
+
+    if prefetch and new_packages:
+        print(f"Fetching modules for {len(new_packages)} packages")
+        shaper.util.run_batch(prefetch_go_package, new_packages)
+    jobs = min(shaper.util.job_limit(jobs, memory_per_job), len(new_packages) or 1)
+    build_jobs = max(1, JOBS // jobs)
+    _, failures = shaper.util.run_batch(
+        lambda package: install_go_package(package, build_jobs), new_packages, jobs
+    )
+    if failures:
+        raise RuntimeError(f"{len(failures)} Go packages failed to install")
 
 
 if __name__ == "__main__":
@@ -1,6 +1,6 @@
 """Utility functions for managing local Python virtual environment."""
 import json
-import subprocess
+import re
 import venv
 from pathlib import Path
 
@@ -16,6 +16,28 @@ def create_venv() -> None:
         venv.create(VENV, system_site_packages=True, with_pip=True, upgrade_deps=True)
 
 
+def normalize(name: str) -> str:
+    """Normalize a Python project name, per PEP 503.
+
+    Args:
+        name: project name
+
+    Returns:
+        lowercase name with runs of -, _, and . replaced by -
+    """
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def site_packages() -> list:
+    """Locate site-packages directories of the virtual env and the system.
+
+    Returns:
+        a list of paths whose stats change when packages change
+    """
+    return [*VENV.glob("lib*/python*/site-packages"), *shaper.util.RPMDB]
+
+
+@shaper.util.inventory_cache("pip", site_packages)
 def existing_pip() -> set:
     """Obtain list of installed python packages.
 
@@ -23,10 +45,29 @@ def existing_pip() -> set:
         a set of package names
     """
     command = [PIP, "list", "--format", "json"]
-    packages = subprocess.check_output(command)
+    packages = shaper.util.check_output(command)
     return {p["name"] for p in json.loads(packages)}
 
 
+def missing_pip_packages(filename: str) -> set:
+    """Determine which requirements listed in file are not installed.
+
+    Args:
+        filename: path to requirements file
+
+    Returns:
+        a set of normalized project names
+    """
+    installed = existing_pip() if PIP.exists() else set()
+    existing = {normalize(name) for name in installed}
+    requirements = {
+        normalize(re.split(r"[\s<>=!~;\[@]", line.strip(), 1)[0])
+        for line in shaper.util.get_set_from_file(filename)
+        if line.strip() and not line.lstrip().startswith(("#", "-"))
+    }
+    return requirements - existing
+
+
 def install_pip_packages(filename: str) -> None:
     """Install python packages from text file.
 
@@ -35,7 +76,7 @@ def install_pip_packages(filename: str) -> None:
     """
     create_venv()
     cmd = [PIP, "install", "-Ur", filename]
-    subprocess.check_call(cmd)
+    shaper.util.check_call(cmd)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,35 @@
 """Utility functions for managing node packages."""
+import functools
 import os
 import pathlib
 import shlex
+import shutil
 import subprocess
+import typing
 
 import shaper.download
 import shaper.util
 
 NPM = ["volta", "run", "--npm", "latest", "npm"]
+VOLTA_PACKAGES = pathlib.Path.home() / ".volta" / "tools" / "user" / "packages"
+
+
+def add_volta_path() -> None:
+    """Make sure volta and the tools it manages are on PATH."""
+    HOME = pathlib.Path.home()
+    os.environ["VOLTA_HOME"] = f"{HOME}/.volta"
+    if f"{HOME}/.volta/bin" not in os.environ.get("PATH", "").split(os.pathsep):
+        os.environ["PATH"] = f"{HOME}/.volta/bin:{os.environ.get('PATH')}"
+
+
+def missing_volta() -> set:
+    """Determine if volta is missing.
+
+    Returns:
+        a set containing "volta" if it is not installed
+    """
+    add_volta_path()
+    return set() if shutil.which("volta") else {"volta"}
 
 
 def install_volta() -> None:
@@ -15,33 +37,101 @@ def install_volta() -> None:
     shaper.download.install_with_remote_script(
         "volta", "https://get.volta.sh", ["--skip-setup"]
     )
-    HOME = pathlib.Path.home()
-    os.environ.update(
-        {
-            "VOLTA_HOME": f"{HOME}/.volta",
-            "PATH": f"{HOME}/.volta/bin:{os.environ.get('PATH')}",
-        }
-    )
+    add_volta_path()
     try:
-        subprocess.check_output(["node", "-v"])
+        shaper.util.check_output(["node", "-v"])
     except (subprocess.CalledProcessError, FileNotFoundError):
-        subprocess.check_call(["volta", "install", "node"])
+        shaper.util.check_call(["volta", "install", "node"])
+
 
+def package_name(line: str) -> typing.Optional[str]:
+    """Extract the package name from a line of `volta list --format plain`.
 
+    Args:
+        line: line of output, such as "package @scope/name@1.0.0 / node@20"
+
+    Returns:
+        package name without version, or None for other lines
+    """
+    if not line.startswith("package"):
+        return None
+    spec = line.split()[1]
+    return spec[0] + spec[1:].split("@")[0]
+
+
+@functools.cache
+@shaper.util.inventory_cache(
+    "npm", lambda: [VOLTA_PACKAGES, *VOLTA_PACKAGES.glob("*.json")]
+)
 def existing_npm() -> set:
     """Obtain list of globally-installed npm packages.
 
+    The Volta inventory is read once and cached for the rest of the run.
+
     Returns:
         a set of package names
     """
     command = ["volta", "list", "--format", "plain"]
 
     try:
-        lines = shaper.util.get_set_from_output(command)
+        return shaper.util.get_set_from_output(command, package_name)
     except (subprocess.CalledProcessError, FileNotFoundError):
-        lines = set()
+        return set()
+
+
+def option_groups(lines: typing.Iterable[str]) -> dict:
+    """Group package lines by the options they carry.
+
+    Args:
+        lines: package lines, each possibly with options
 
-    return {l.split()[1].split("@")[0] for l in lines if l.startswith("package")}
+    Returns:
+        a dict of sorted option tuple to the lines with exactly those options
+    """
+    groups: dict = {}
+    for line in lines:
+        options = tuple(sorted(a for a in shlex.split(line) if a.startswith("-")))
+        groups.setdefault(options, []).append(line)
+    return groups
+
+
+def install_npm_batch(lines: list) -> list:
+    """Install npm packages in one transaction, bisecting on failure.
+
+    Options on any line apply to the whole transaction, so lines should be
+    grouped with option_groups first.
+
+    Args:
+        lines: package lines, each possibly with options
+
+    Returns:
+        a list of lines that failed to install
+    """
+    cmd = [*NPM, "install", "-g"]
+    try:
+        shaper.util.check_call(
+            cmd + [arg for line in lines for arg in shlex.split(line)]
+        )
+    except subprocess.CalledProcessError:
+        if len(lines) == 1:
+            print(f"Failed {lines[0]}")
+            return lines
+        middle = len(lines) // 2
+        return install_npm_batch(lines[:middle]) + install_npm_batch(lines[middle:])
+    return []
+
+
+def missing_npm_packages(filename: str) -> set:
+    """Determine which packages listed in file are not installed.
+
+    Args:
+        filename: path to text file listing packages
+
+    Returns:
+        a set of package lines
+    """
+    add_volta_path()
+    return shaper.util.get_set_from_file(filename) - existing_npm() - {""}
 
 
 def install_npm_packages(filename: str) -> None:
@@ -49,11 +139,17 @@ def install_npm_packages(filename: str) -> None:
 
     Args:
         filename: path to text file listing packages
+
+    Raises:
+        RuntimeError: if any package failed to install
     """
-    install_volta()
-    to_install = shaper.util.get_set_from_file(filename)
-    existing = existing_npm()
-    cmd = [*NPM, "install", "-g"]
-    new_packages = to_install - existing
-    for line in new_packages:
-        subprocess.check_call(cmd + shlex.split(line))
+    new_packages = sorted(missing_npm_packages(filename))
+    if new_packages:
+        failures = [
+            line
+            for group in option_groups(new_packages).values()
+            for line in install_npm_batch(group)
+        ]
+        existing_npm.cache_clear()
+        if failures:
+            raise RuntimeError(f"{len(failures)} npm packages failed to install")
@@ -0,0 +1,105 @@
+"""Report pending changes for every playbook step without executing any."""
+import collections
+import concurrent.futures
+import contextlib
+import inspect
+import sys
+import time
+import typing
+
+import shaper.dnf
+import shaper.dotfiles
+import shaper.download
+import shaper.fonts
+import shaper.golang
+import shaper.localpy
+import shaper.minecraft
+import shaper.npm
+import shaper.rust
+
+PLANNERS = {
+    shaper.dnf.install_rpm_keys: shaper.dnf.missing_rpm_keys,
+    shaper.dnf.install_dnf_repos: shaper.dnf.missing_dnf_repos,
+    shaper.dnf.install_copr_repos: shaper.dnf.missing_copr_repos,
+    shaper.dnf.install_rpmfusion: shaper.dnf.missing_rpmfusion,
+    shaper.dnf.install_dnf_packages: shaper.dnf.missing_dnf_packages,
+    shaper.dotfiles.dotfile_git_restore: shaper.dotfiles.missing_dotfiles,
+    shaper.download.install_with_remote_script: shaper.download.missing_remote_script,
+    shaper.fonts.install_fonts: shaper.fonts.missing_fonts,
+    shaper.golang.go_update: shaper.golang.missing_go,
+    shaper.golang.install_go_packages: shaper.golang.missing_go_packages,
+    shaper.localpy.install_pip_packages: shaper.localpy.missing_pip_packages,
+    shaper.minecraft.multimc_update: shaper.minecraft.missing_multimc,
+    shaper.npm.install_volta: shaper.npm.missing_volta,
+    shaper.npm.install_npm_packages: shaper.npm.missing_npm_packages,
+    shaper.rust.install_rust_packages: shaper.rust.missing_rust_packages,
+}
+
+
+def planner_kwargs(planner: typing.Callable, kwargs: dict) -> dict:
+    """Select the keyword arguments of a step that its planner accepts.
+
+    Others, such as in_process or jobs, change how a step installs but not
+    what it would install.
+
+    Args:
+        planner: function from PLANNERS
+        kwargs: keyword arguments of the step
+
+    Returns:
+        keyword arguments to pass to planner
+    """
+    parameters = inspect.signature(planner).parameters
+    if any(p.kind is p.VAR_KEYWORD for p in parameters.values()):
+        return dict(kwargs)
+    return {k: v for k, v in kwargs.items() if k in parameters}
+
+
+def plan_step(step: typing.Any) -> dict:
+    """Run the inventory probe for one step.
+
+    Args:
+        step: a shaper.steps.Step; its planner gets the same positional args,
+            and the keyword args it accepts
+
+    Returns:
+        dict with sorted pending actions and seconds taken, or an error
+    """
+    planner = PLANNERS.get(step.function)
+    if planner is None:
+        return {"error": f"no planner for {step.function.__qualname__}"}
+    start = time.perf_counter()
+    try:
+        pending = sorted(planner(*step.args, **planner_kwargs(planner, step.kwargs)))
+    except Exception as error:
+        return {"error": f"{type(error).__name__}: {error}"}
+    return {"pending": pending, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def plan(steps: typing.Iterable, workers: int = 8) -> dict:
+    """Probe every step concurrently and report what each would change.
+
+    Steps are grouped by module, and each group is probed in order in its
+    own thread, so that probes sharing a package manager never overlap.
+    Progress messages go to stderr, leaving stdout for the report.
+
+    Args:
+        steps: shaper.steps.Step objects
+        workers: maximum number of groups probed at once
+
+    Returns:
+        a dict of step name to plan_step result, in step order
+    """
+    steps = list(steps)
+    groups = collections.defaultdict(list)
+    for step in steps:
+        groups[step.function.__module__].append(step)
+    results = {}
+    with contextlib.redirect_stdout(sys.stderr):
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            for group in executor.map(
+                lambda group: [(s.name, plan_step(s)) for s in group],
+                groups.values(),
+            ):
+                results.update(group)
+    return {step.name: results[step.name] for step in steps}
@@ -2,41 +2,89 @@
 import os
 import pathlib
 import subprocess
+import typing
 
 import shaper.util
 
+CARGO_HOME = pathlib.Path.home() / ".cargo"
+TARGET_DIR = shaper.util.CACHE_DIR / "cargo-target"
 
+
+def add_cargo_path() -> None:
+    """Make sure cargo is on PATH."""
+    bin_dir = f"{CARGO_HOME}/bin"
+    if bin_dir not in os.environ.get("PATH", "").split(os.pathsep):
+        os.environ["PATH"] = f"{bin_dir}:{os.environ.get('PATH')}"
+
+
+def crate_name(line: str) -> typing.Optional[str]:
+    """Extract a crate or binary name from a line of `cargo install --list`.
+
+    Args:
+        line: line of output, either "crate v1.0.0:" or an indented binary
+
+    Returns:
+        crate or binary name, or None for blank lines
+    """
+    if not line:
+        return None
+    return line.strip() if line.startswith("  ") else line.split()[0]
+
+
+@shaper.util.inventory_cache("rust", lambda: [CARGO_HOME / ".crates2.json"])
 def existing_rust() -> set:
     """Obtain list of installed rust packages.
 
     Returns:
-        a set of package names
+        a set of crate and binary names
     """
-    HOME = pathlib.Path.home()
-    os.environ.update(
-        {
-            "PATH": f"{HOME}/.cargo/bin:{os.environ.get('PATH')}",
-        }
-    )
+    add_cargo_path()
     cmd = ["cargo", "install", "--list"]
-    packages = shaper.util.get_set_from_output(cmd)
-    return {l.strip() for l in packages if l.startswith("  ")}
+    return shaper.util.get_set_from_output(cmd, crate_name)
+
+
+def missing_rust_packages(filename: str) -> set:
+    """Determine which crates listed in file are not installed.
+
+    Args:
+        filename: path to text file listing packages
+
+    Returns:
+        a set of crate names
+    """
+    add_cargo_path()
+    return shaper.util.get_set_from_file(filename) - existing_rust() - {""}
 
 
 def install_rust_packages(filename: str) -> None:
     """Install rust packages from text file.
 
+    All crates are passed to a single cargo invocation sharing one target
+    directory, so common dependencies are compiled only once.
+
     Args:
         filename: path to text file listing packages
+
+    Raises:
+        RuntimeError: if any crate failed to install
     """
-    existing = existing_rust()
-    to_install = shaper.util.get_set_from_file(filename)
-    new_packages = to_install - existing
+    new_packages = missing_rust_packages(filename)
+    if not new_packages:
+        return
     print(new_packages)
 
-    for package in new_packages:
-        cmd = ["cargo", "install", package]
-        subprocess.check_call(cmd)
+    cmd = ["cargo", "install", *sorted(new_packages)]
+    env = {**os.environ, "CARGO_TARGET_DIR": str(TARGET_DIR)}
+    try:
+        shaper.util.check_call(cmd, env=env)
+    except subprocess.CalledProcessError:
+        # cargo carries on past a failed crate; find out which ones
+        pass
+    failures = new_packages - existing_rust()
+    for package in sorted(new_packages):
+        print(f"{'Failed' if package in failures else 'Installed'} {package}")
+    if failures:
+        raise RuntimeError(f"{len(failures)} Rust packages failed to install")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,183 @@
+"""Journal of successful steps, so unchanged steps can be skipped."""
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import typing
+
+import shaper.dnf
+import shaper.fonts
+import shaper.golang
+import shaper.localpy
+import shaper.npm
+import shaper.rust
+import shaper.util
+
+JOURNAL = shaper.util.CACHE_DIR / "state.json"
+CHECKPOINTS = shaper.util.CACHE_DIR / "runs"
+
+# Steps that fetch the latest release or run remote scripts are not listed,
+# as their outcome depends on more than local state, so they always run.
+STATE_PROBES = {
+    shaper.dnf.install_rpm_keys: shaper.dnf.existing_rpm_keys.fingerprint,
+    shaper.dnf.install_dnf_repos: lambda: shaper.util.fingerprint(
+        [shaper.dnf.REPOS_DIR]
+    ),
+    shaper.dnf.install_copr_repos: lambda: shaper.util.fingerprint(
+        [shaper.dnf.REPOS_DIR]
+    ),
+    shaper.dnf.install_rpmfusion: shaper.dnf.existing_dnf.fingerprint,
+    shaper.dnf.install_dnf_packages: shaper.dnf.existing_dnf.fingerprint,
+    shaper.fonts.install_fonts: shaper.fonts.existing_fonts.fingerprint,
+    shaper.golang.install_go_packages: shaper.golang.existing_go.fingerprint,
+    shaper.localpy.install_pip_packages: shaper.localpy.existing_pip.fingerprint,
+    shaper.npm.install_npm_packages: shaper.npm.existing_npm.fingerprint,
+    shaper.rust.install_rust_packages: shaper.rust.existing_rust.fingerprint,
+}
+
+journal_lock = threading.Lock()
+
+
+def step_key(step: typing.Any) -> str:
+    """Identify a step by its function and arguments.
+
+    Args:
+        step: a shaper.steps.Step
+
+    Returns:
+        a key that is the same for the same step in any playbook
+    """
+    function = f"{step.function.__module__}.{step.function.__qualname__}"
+    return f"{function}{step.args!r}{sorted(step.kwargs.items())!r}"
+
+
+def input_hash(step: typing.Any) -> str:
+    """Hash the arguments of a step and the contents of files they name.
+
+    Args:
+        step: a shaper.steps.Step
+
+    Returns:
+        hexadecimal sha256 digest
+    """
+    digest = hashlib.sha256(step_key(step).encode())
+    for arg in (*step.args, *step.kwargs.values()):
+        if isinstance(arg, (str, os.PathLike)) and os.path.isfile(arg):
+            with open(arg, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def fingerprint(step: typing.Any) -> typing.Optional[dict]:
+    """Fingerprint the inputs and managed state of a step.
+
+    Args:
+        step: a shaper.steps.Step
+
+    Returns:
+        dict with input hash and state fingerprint, or None if the step's
+        state cannot be fingerprinted
+    """
+    probe = STATE_PROBES.get(step.function)
+    if probe is None:
+        return None
+    return {"inputs": input_hash(step), "state": probe()}
+
+
+def read_journal() -> dict:
+    """Load the journal of successful steps.
+
+    Returns:
+        a dict of step key to fingerprint
+    """
+    try:
+        return json.loads(JOURNAL.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def unchanged(step: typing.Any) -> bool:
+    """Determine if a step's inputs and state match its last success.
+
+    Args:
+        step: a shaper.steps.Step
+
+    Returns:
+        True if the step can be skipped
+    """
+    current = fingerprint(step)
+    return current is not None and read_journal().get(step_key(step)) == current
+
+
+def record(step: typing.Any) -> None:
+    """Record the inputs and resulting state of a successful step.
+
+    Args:
+        step: a shaper.steps.Step
+    """
+    current = fingerprint(step)
+    if current is None:
+        return
+    with journal_lock:
+        journal = read_journal()
+        journal[step_key(step)] = current
+        shaper.util.write_json(JOURNAL, journal)
+
+
+class Checkpoint:
+    """Steps completed so far in a playbook run, kept until the run succeeds."""
+
+    def __init__(self, name: str, resume: bool = False):
+        """Start a run, or resume the last unfinished one.
+
+        Args:
+            name: playbook name, identifying the checkpoint file
+            resume: keep steps completed by the last unfinished run
+        """
+        self.path = CHECKPOINTS / f"{name}.json"
+        self.lock = threading.Lock()
+        self.steps: dict = {}
+        if resume:
+            try:
+                self.steps = json.loads(self.path.read_text())["steps"]
+            except (OSError, ValueError, KeyError):
+                pass
+        else:
+            self.clear()
+
+    def completed(self, step: typing.Any, verify: bool = False) -> bool:
+        """Determine if a step already succeeded with the same inputs.
+
+        Args:
+            step: a shaper.steps.Step
+            verify: also require the step's state fingerprint to be unchanged;
+                steps without one are then never considered complete
+
+        Returns:
+            True if the step can be skipped
+        """
+        entry = self.steps.get(step.name)
+        if entry is None or entry["inputs"] != input_hash(step):
+            return False
+        if not verify:
+            return True
+        probe = STATE_PROBES.get(step.function)
+        return probe is not None and entry["state"] == probe()
+
+    def record(self, step: typing.Any) -> None:
+        """Record a successful step.
+
+        Args:
+            step: a shaper.steps.Step
+        """
+        probe = STATE_PROBES.get(step.function)
+        entry = {"inputs": input_hash(step), "state": probe() if probe else None}
+        with self.lock:
+            self.steps[step.name] = entry
+            shaper.util.write_json(self.path, {"steps": self.steps})
+
+    def clear(self) -> None:
+        """Forget the run, once it has finished successfully."""
+        with contextlib.suppress(FileNotFoundError):
+            self.path.unlink()
@@ -0,0 +1,281 @@
+"""Dependency-aware, concurrent scheduler for playbook steps."""
+import argparse
+import concurrent.futures
+import io
+import json
+import pathlib
+import sys
+import threading
+import traceback
+import typing
+
+import shaper.util
+
+if typing.TYPE_CHECKING:
+    import shaper.state
+
+WORKERS = 4
+
+
+class Step(typing.NamedTuple):
+    """A named playbook step and the steps it must wait for."""
+
+    name: str
+    function: typing.Callable
+    args: tuple
+    kwargs: dict
+    after: tuple
+
+
+class PrefixedOutput(io.TextIOBase):
+    """Text stream that prefixes each line with the name of the current step."""
+
+    def __init__(self, stream: typing.TextIO):
+        """Wrap a text stream.
+
+        Args:
+            stream: underlying stream, usually sys.stdout
+        """
+        super().__init__()
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def write(self, text: str) -> int:
+        """Write text, holding back partial lines until they are complete.
+
+        Args:
+            text: text to write
+
+        Returns:
+            number of characters written
+        """
+        step = shaper.util.current_step()
+        if not step:
+            with self.lock:
+                self.stream.write(text)
+            return len(text)
+        pending = getattr(self.local, "pending", "") + text
+        *lines, self.local.pending = pending.split("\n")
+        if lines:
+            with self.lock:
+                self.stream.writelines(f"[{step}] {line}\n" for line in lines)
+                self.stream.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        """Write out any partial line from the current thread."""
+        pending = getattr(self.local, "pending", "")
+        if pending:
+            self.local.pending = ""
+            self.write(pending + "\n")
+        with self.lock:
+            self.stream.flush()
+
+
+class Playbook:
+    """Collection of steps, run concurrently as their dependencies complete."""
+
+    def __init__(self, name: typing.Optional[str] = None):
+        """Start with no steps.
+
+        Args:
+            name: identifies checkpoints of unfinished runs, defaulting to the
+                name of the playbook script
+        """
+        self.name = name or pathlib.Path(sys.argv[0]).stem
+        self.steps: dict = {}
+
+    def add(
+        self,
+        name: str,
+        function: typing.Callable,
+        *args,
+        after: typing.Iterable[str] = (),
+        **kwargs,
+    ) -> None:
+        """Declare a step.
+
+        Args:
+            name: unique step name, used to prefix output
+            function: callable to run
+            args: positional arguments for function
+            after: names of steps that must succeed first
+            kwargs: keyword arguments for function
+
+        Raises:
+            ValueError: if name is taken or a dependency is not declared yet
+        """
+        after = tuple(after)
+        if name in self.steps:
+            raise ValueError(f"Duplicate step {name}")
+        unknown = [a for a in after if a not in self.steps]
+        if unknown:
+            raise ValueError(f"Step {name} depends on unknown steps {unknown}")
+        self.steps[name] = Step(name, function, args, kwargs, after)
+
+    def run_step(
+        self,
+        step: Step,
+        force: bool = False,
+        checkpoint: typing.Optional["shaper.state.Checkpoint"] = None,
+        verify: bool = False,
+    ) -> None:
+        """Run a single step with its name attached to this thread.
+
+        Args:
+            step: the step to run
+            force: run even if inputs and state are unchanged since last success
+            checkpoint: skip the step if it completed earlier in this run, and
+                record it when it succeeds
+            verify: with checkpoint, skip only if its state is also unchanged
+        """
+        import shaper.state
+
+        shaper.util.context.step = step.name
+        try:
+            if checkpoint and checkpoint.completed(step, verify):
+                print("Completed earlier in this run, skipping")
+                return
+            if not force and shaper.state.unchanged(step):
+                print("Unchanged since last success, skipping")
+                return
+            with shaper.util.span(step.name):
+                step.function(*step.args, **step.kwargs)
+            shaper.state.record(step)
+            if checkpoint:
+                checkpoint.record(step)
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+            raise
+        finally:
+            sys.stdout.flush()
+            shaper.util.context.step = ""
+
+    def run(
+        self,
+        workers: int = WORKERS,
+        force: bool = False,
+        checkpoint: typing.Optional["shaper.state.Checkpoint"] = None,
+        verify: bool = False,
+    ) -> dict:
+        """Run all steps, each as soon as the steps it depends on succeed.
+
+        Args:
+            workers: maximum number of steps to run at once
+            force: run steps even if unchanged since their last success
+            checkpoint: journal of completed steps, cleared if all succeed
+            verify: re-check the state of steps completed earlier in the run
+
+        Returns:
+            dict of step name to "ok", "failed", or "skipped"
+        """
+        status: dict = {}
+        running: dict = {}
+        original_stdout = sys.stdout
+        sys.stdout = PrefixedOutput(original_stdout)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+                while len(status) < len(self.steps):
+                    for step in self.steps.values():
+                        if step.name in status or step.name in running.values():
+                            continue
+                        states = [status.get(a) for a in step.after]
+                        if "failed" in states or "skipped" in states:
+                            print(f"Skipping {step.name}")
+                            status[step.name] = "skipped"
+                        elif all(s == "ok" for s in states):
+                            future = executor.submit(
+                                self.run_step, step, force, checkpoint, verify
+                            )
+                            running[future] = step.name
+                    if not running:
+                        continue
+                    done, _ = concurrent.futures.wait(
+                        running, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in done:
+                        name = running.pop(future)
+                        status[name] = "failed" if future.exception() else "ok"
+                        print(f"Finished {name}: {status[name]}")
+        finally:
+            sys.stdout = original_stdout
+        if checkpoint and all(s == "ok" for s in status.values()):
+            checkpoint.clear()
+        return status
+
+    def plan(self, workers: int) -> dict:
+        """Report what each step would change, without changing anything.
+
+        Args:
+            workers: maximum number of ecosystems to probe at once
+
+        Returns:
+            dict of step name to report, as from shaper.plan.plan
+        """
+        import shaper.plan
+
+        return shaper.plan.plan(self.steps.values(), workers)
+
+    def main(self, argv: typing.Optional[list] = None) -> None:
+        """Parse command line options and run the playbook.
+
+        Args:
+            argv: command line arguments, defaulting to sys.argv
+        """
+        parser = argparse.ArgumentParser()
+        parser.add_argument(
+            "-j",
+            "--workers",
+            type=int,
+            default=WORKERS,
+            help="maximum number of steps to run at once",
+        )
+        parser.add_argument(
+            "--plan",
+            action="store_true",
+            help="print pending changes for each step as JSON, and change nothing",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="run steps even if unchanged since their last success",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="skip steps completed by the last unfinished run",
+        )
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="with --resume, re-check the state of completed steps",
+        )
+        parser.add_argument(
+            "--trace",
+            type=pathlib.Path,
+            help="write a Chrome trace of steps and commands to this JSON file",
+        )
+        args = parser.parse_args(argv)
+        if args.verify and not args.resume:
+            parser.error("--verify requires --resume")
+        if args.plan:
+            report = self.plan(args.workers)
+            print(json.dumps(report, indent=2))
+            if any("error" in r for r in report.values()):
+                sys.exit(1)
+            return
+        # Imported here, as it loads every ecosystem module
+        import shaper.state
+
+        if args.workers > 1:
+            # Prime sudo so concurrent steps don't race for the password prompt
+            with shaper.util.popen(["sudo", "-v"]):
+                pass
+        checkpoint = shaper.state.Checkpoint(self.name, args.resume)
+        status = self.run(args.workers, args.force, checkpoint, args.verify)
+        print(shaper.util.summary(), file=sys.stderr)
+        if args.trace:
+            shaper.util.write_trace(args.trace)
+        if any(s != "ok" for s in status.values()):
+            sys.exit(1)
@@ -1,7 +1,28 @@
 """Utility functions."""
 
+import concurrent.futures
+import contextlib
+import functools
+import json
+import os
 import pathlib
 import subprocess
+import threading
+import time
+import typing
+
+context = threading.local()
+JOBS = 8
+CACHE_DIR = pathlib.Path(
+    os.environ.get("XDG_CACHE_HOME", pathlib.Path.home() / ".cache"), "shaper"
+)
+RPMDB = (
+    pathlib.Path("/usr/lib/sysimage/rpm/rpmdb.sqlite"),
+    pathlib.Path("/usr/lib/sysimage/rpm/rpmdb.sqlite-wal"),
+    pathlib.Path("/var/lib/rpm/Packages"),
+)
+EPOCH = time.perf_counter()
+spans: list = []
 
 
 def get_set_from_file(filename: str) -> set:
@@ -18,14 +39,423 @@ def get_set_from_file(filename: str) -> set:
     return set(lines)
 
 
-def get_set_from_output(command: list) -> set:
+def get_set_from_output(
+    command: list, transform: typing.Optional[typing.Callable] = None, **kwargs
+) -> set:
     """Obtain set from lines of command output
 
     Args:
         command: list with command and arguments
+        transform: optional callable applied to each line, as in iter_output
+        kwargs: extra keyword arguments passed to subprocess.Popen
+
+    Returns:
+        a set of lines, or of transformed values, from output
+    """
+    return set(iter_output(command, transform, **kwargs))
+
+
+def fingerprint(paths: typing.Iterable) -> list:
+    """Cheaply fingerprint files and directories by their stat results.
+
+    Args:
+        paths: files or directories; missing ones are allowed
+
+    Returns:
+        a JSON-serializable list of path, mtime, size, and inode
+    """
+    result = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            result.append([str(path), None])
+        else:
+            result.append([str(path), stat.st_mtime_ns, stat.st_size, stat.st_ino])
+    return result
+
+
+def write_json(path: pathlib.Path, data: typing.Any) -> None:
+    """Atomically write JSON data to a file, creating directories.
+
+    Args:
+        path: destination file
+        data: JSON-serializable data
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+    temporary.write_text(json.dumps(data))
+    temporary.replace(path)
+
+
+def inventory_cache(name: str, paths: typing.Callable) -> typing.Callable:
+    """Cache the result of an inventory probe on disk.
+
+    The cached result is reused for as long as the fingerprint of the
+    given paths is unchanged, so the probe's command is not run.
+
+    Args:
+        name: cache entry name
+        paths: callable returning paths whose stats fingerprint the inventory
+
+    Returns:
+        decorator for a probe function returning a set or dict
+    """
+    cache_file = CACHE_DIR / "inventory" / f"{name}.json"
+
+    def decorator(probe: typing.Callable) -> typing.Callable:
+        @functools.wraps(probe)
+        def wrapper() -> typing.Union[set, dict]:
+            key = fingerprint(paths())
+            try:
+                cached = json.loads(cache_file.read_text())
+                if cached["fingerprint"] == key:
+                    items = cached["items"]
+                    return set(items) if isinstance(items, list) else items
+            except (OSError, ValueError, KeyError):
+                pass
+            result = probe()
+            items = sorted(result) if isinstance(result, set) else result
+            write_json(cache_file, {"fingerprint": key, "items": items})
+            return result
+
+        wrapper.fingerprint = lambda: fingerprint(paths())
+        return wrapper
+
+    return decorator
+
+
+def current_step() -> str:
+    """Name of the playbook step running in this thread.
 
     Returns:
-        a set of lines from output
+        step name, or empty string outside of a step
     """
-    output_list = subprocess.check_output(command, text=True).splitlines()
-    return set(output_list)
+    return getattr(context, "step", "")
+
+
+def call_in_step(step: str, function: typing.Callable, *args, **kwargs) -> typing.Any:
+    """Call function from a worker thread on behalf of a playbook step.
+
+    Args:
+        step: step name, as from current_step
+        function: callable to run
+        args: positional arguments for function
+        kwargs: keyword arguments for function
+
+    Returns:
+        result of function
+    """
+    context.step = step
+    try:
+        return function(*args, **kwargs)
+    finally:
+        context.step = ""
+
+
+class Span(typing.NamedTuple):
+    """Timing of a command or a playbook step."""
+
+    name: str
+    category: str
+    step: str
+    start: float
+    wall: float
+    cpu: float = 0.0
+    returncode: typing.Optional[int] = None
+    output_bytes: int = 0
+
+
+@contextlib.contextmanager
+def span(name: str, category: str = "step") -> typing.Iterator[None]:
+    """Record the wall time of a block of code.
+
+    Args:
+        name: what is being timed, such as a step name
+        category: kind of span, for grouping in traces
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        spans.append(Span(name, category, current_step(), start - EPOCH, wall))
+
+
+@contextlib.contextmanager
+def popen(command: list, **kwargs) -> typing.Iterator[subprocess.Popen]:
+    """Start command, recording its wall time, CPU time, and exit status.
+
+    All commands run by shaper go through here. The process is reaped with
+    os.wait4 to obtain its resource usage. Callers that read its output
+    should add the number of bytes read to process.output_bytes.
+
+    Args:
+        command: list with command and arguments
+        kwargs: extra keyword arguments passed to subprocess.Popen
+
+    Yields:
+        the running process, which has exited once the block ends
+    """
+    start = time.perf_counter()
+    cpu = 0.0
+    process = subprocess.Popen(command, **kwargs)
+    process.output_bytes = 0
+    try:
+        with process:
+            yield process
+            if process.stdin:
+                with contextlib.suppress(BrokenPipeError):
+                    process.stdin.close()
+            if process.returncode is None:
+                _, status, usage = os.wait4(process.pid, 0)
+                process.returncode = os.waitstatus_to_exitcode(status)
+                cpu = usage.ru_utime + usage.ru_stime
+    finally:
+        spans.append(
+            Span(
+                " ".join(map(str, command)),
+                "command",
+                current_step(),
+                start - EPOCH,
+                time.perf_counter() - start,
+                cpu,
+                process.returncode,
+                process.output_bytes,
+            )
+        )
+
+
+def check_call(command: list, **kwargs) -> None:
+    """Run command, relaying its output through the current step.
+
+    Outside of a playbook step, or if stdout is redirected, output goes
+    straight to the terminal. Inside a step, output is read line by line and
+    printed, so that it gets the step prefix.
+
+    Args:
+        command: list with command and arguments
+        kwargs: extra keyword arguments passed to subprocess.Popen
+
+    Raises:
+        CalledProcessError: if command exits with non-zero status
+    """
+    if not current_step() or "stdout" in kwargs:
+        with popen(command, **kwargs) as process:
+            pass
+    else:
+        with popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs
+        ) as process:
+            for line in process.stdout:
+                process.output_bytes += len(line)
+                print(line.decode(errors="replace"), end="")
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def check_output(command: list, **kwargs) -> typing.Union[str, bytes]:
+    """Run command and return its output.
+
+    Args:
+        command: list with command and arguments
+        kwargs: extra keyword arguments passed to subprocess.Popen
+
+    Returns:
+        output of command
+
+    Raises:
+        CalledProcessError: if command exits with non-zero status
+    """
+    with popen(command, stdout=subprocess.PIPE, **kwargs) as process:
+        output = process.stdout.read()
+        process.output_bytes = len(output)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command, output)
+    return output
+
+
+def iter_output(
+    command: list, transform: typing.Optional[typing.Callable] = None, **kwargs
+) -> typing.Iterator:
+    """Parse lines of command output as they arrive.
+
+    Only the values extracted by transform are kept, so memory use follows
+    the size of the result rather than of the output.
+
+    Args:
+        command: list with command and arguments
+        transform: optional callable taking a line without its newline, and
+            returning a value, or None to skip the line
+        kwargs: extra keyword arguments passed to subprocess.Popen
+
+    Yields:
+        each line, or each value returned by transform that is not None
+
+    Raises:
+        CalledProcessError: if command exits with non-zero status
+    """
+    with popen(
+        command, stdout=subprocess.PIPE, text=True, errors="replace", **kwargs
+    ) as process:
+        for line in process.stdout:
+            process.output_bytes += len(line)
+            line = line.rstrip("\n")
+            value = transform(line) if transform else line
+            if value is not None:
+                yield value
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+
+
+def summary(limit: int = 10) -> str:
+    """Summarize where time went, per step and for the slowest commands.
+
+    Args:
+        limit: number of slowest commands to list
+
+    Returns:
+        a text table
+    """
+    steps: dict = {}
+    for item in spans:
+        totals = steps.setdefault(item.step or item.name, [0.0, 0, 0.0, 0.0, 0])
+        if item.category == "step":
+            totals[0] += item.wall
+        else:
+            totals[1] += 1
+            totals[2] += item.wall
+            totals[3] += item.cpu
+            totals[4] += item.output_bytes
+    lines = [
+        f"{'step':24} {'wall':>9} {'commands':>8} {'cmd wall':>9} {'cmd cpu':>9} "
+        f"{'output':>9}"
+    ]
+    for name, (wall, count, cmd_wall, cpu, output) in sorted(
+        steps.items(), key=lambda item: -max(item[1][0], item[1][2])
+    ):
+        lines.append(
+            f"{name[:24]:24} {wall:8.1f}s {count:8} {cmd_wall:8.1f}s {cpu:8.1f}s "
+            f"{output / 1024:7.0f}KB"
+        )
+    commands = sorted(
+        (s for s in spans if s.category == "command"), key=lambda s: -s.wall
+    )
+    lines.append("")
+    lines.append(f"{'slowest commands':24} {'wall':>9} {'cpu':>9} {'status':>6}")
+    for item in commands[:limit]:
+        lines.append(
+            f"{item.step[:24]:24} {item.wall:8.1f}s {item.cpu:8.1f}s "
+            f"{item.returncode!s:>6}  {item.name[:60]}"
+        )
+    return "\n".join(lines)
+
+
+def write_trace(path: pathlib.Path) -> None:
+    """Export recorded spans as Chrome trace JSON, for Perfetto or chrome://tracing.
+
+    Each step gets its own track, holding the step and the commands it ran.
+
+    Args:
+        path: destination file
+    """
+    tracks: dict = {}
+    events = []
+    for item in spans:
+        track = tracks.setdefault(item.step or item.name, len(tracks) + 1)
+        events.append(
+            {
+                "name": item.name,
+                "cat": item.category,
+                "ph": "X",
+                "ts": round(item.start * 1e6),
+                "dur": round(item.wall * 1e6),
+                "pid": os.getpid(),
+                "tid": track,
+                "args": {
+                    "step": item.step,
+                    "cpu": item.cpu,
+                    "returncode": item.returncode,
+                    "output_bytes": item.output_bytes,
+                },
+            }
+        )
+    events.extend(
+        {
+            "name": "thread_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "tid": track,
+            "args": {"name": name},
+        }
+        for name, track in tracks.items()
+    )
+    write_json(path, {"traceEvents": events, "displayTimeUnit": "ms"})
+
+
+def memory_available() -> int:
+    """Estimate memory available for new processes.
+
+    Returns:
+        bytes available, from MemAvailable in /proc/meminfo
+    """
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 1 << 40
+
+
+def job_limit(jobs: int, memory_per_job: int) -> int:
+    """Cap number of concurrent jobs by available memory.
+
+    Args:
+        jobs: requested number of jobs
+        memory_per_job: expected peak memory of one job in bytes
+
+    Returns:
+        number of jobs, at least 1
+    """
+    return max(1, min(jobs, memory_available() // memory_per_job))
+
+
+def run_batch(
+    function: typing.Callable, items: typing.Iterable, jobs: int = JOBS
+) -> typing.Tuple[dict, dict]:
+    """Call function on each item in a bounded thread pool.
+
+    Each item is timed and reported on its own, and a failure does not stop
+    the rest of the batch.
+
+    Args:
+        function: callable taking a single item
+        items: items to process
+        jobs: maximum number of concurrent calls
+
+    Returns:
+        a dict of item to result for successes, and of item to exception
+        for failures
+    """
+    step = current_step()
+
+    def timed(item: typing.Any) -> typing.Tuple[typing.Any, float]:
+        start = time.perf_counter()
+        return call_in_step(step, function, item), time.perf_counter() - start
+
+    results = {}
+    failures = {}
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        futures = {executor.submit(timed, item): item for item in items}
+        for future in concurrent.futures.as_completed(futures):
+            item = futures[future]
+            try:
+                results[item], elapsed = future.result()
+            except Exception as error:
+                failures[item] = error
+                print(f"Failed {item}: {error}")
+            else:
+                print(f"Finished {item} in {elapsed:.1f}s")
+    return results, failures
@@ -0,0 +1,83 @@
+import base64
+
+import pytest
+
+import shaper.dnf
+
+# Debian 12 (bookworm) stable release key, an ed25519 key in old-format packets
+BOOKWORM = """-----BEGIN PGP PUBLIC KEY BLOCK-----
+
+mDMEY865UxYJKwYBBAHaRw8BAQdAd7Z0srwuhlB6JKFkcf4HU4SSS/xcRfwEQWzr
+crf6AEq0SURlYmlhbiBTdGFibGUgUmVsZWFzZSBLZXkgKDEyL2Jvb2t3b3JtKSA8
+ZGViaWFuLXJlbGVhc2VAbGlzdHMuZGViaWFuLm9yZz6IlgQTFggAPhYhBE1k/sEZ
+wgKQZ9bnkfjSWFuHg9SBBQJjzrlTAhsDBQkPCZwABQsJCAcCBhUKCQgLAgQWAgMB
+Ah4BAheAAAoJEPjSWFuHg9SBSgwBAP9qpeO5z1s5m4D4z3TcqDo1wez6DNya27QW
+WoG/4oBsAQCEN8Z00DXagPHbwrvsY2t9BCsT+PgnSn9biobwX7bDDg==
+=5NZE
+-----END PGP PUBLIC KEY BLOCK-----
+"""
+FINGERPRINT = "4d64fec119c2029067d6e791f8d2585b8783d481"
+
+
+def dearmor(armored: str) -> bytes:
+    body = armored.split("\n\n", 1)[1].split("-----END")[0]
+    return base64.b64decode("".join(body.split("\n")[:-2]))
+
+
+def armor(data: bytes) -> str:
+    return (
+        "-----BEGIN PGP PUBLIC KEY BLOCK-----\n\n"
+        f"{base64.b64encode(data).decode()}\n"
+        "-----END PGP PUBLIC KEY BLOCK-----\n"
+    )
+
+
+def new_format(data: bytes) -> bytes:
+    packets = b""
+    for tag, body in shaper.dnf.openpgp_packets(data):
+        # Five-byte lengths exercise the longest header form
+        packets += bytes([0xC0 | tag, 255]) + len(body).to_bytes(4, "big") + body
+    return packets
+
+
+def test_fingerprint_of_real_key():
+    assert shaper.dnf.rpm_key_fingerprints(BOOKWORM) == [FINGERPRINT]
+
+
+def test_new_format_packets():
+    armored = armor(new_format(dearmor(BOOKWORM)))
+
+    assert shaper.dnf.rpm_key_fingerprints(armored) == [FINGERPRINT]
+
+
+def test_several_key_blocks():
+    armored = BOOKWORM.replace("\n", "\r\n") + BOOKWORM
+
+    assert shaper.dnf.rpm_key_fingerprints(armored) == [FINGERPRINT] * 2
+
+
+def test_partial_body_length_is_rejected():
+    with pytest.raises(ValueError):
+        list(shaper.dnf.openpgp_packets(bytes([0xC6, 0xE1]) + b"\0" * 4))
+
+
+def test_truncated_packet_is_rejected():
+    with pytest.raises(ValueError):
+        list(shaper.dnf.openpgp_packets(dearmor(BOOKWORM)[:-1]))
+    with pytest.raises(ValueError):
+        list(shaper.dnf.openpgp_packets(bytes([0xC6, 0xC1])))
+
+
+def test_installed_by_short_key_id():
+    installed = {FINGERPRINT[-8:]: "Debian Stable Release Key"}
+
+    assert shaper.dnf.rpm_key_installed(installed, "Fedora", BOOKWORM)
+    assert not shaper.dnf.rpm_key_installed({}, "Debian", BOOKWORM)
+
+
+def test_unparseable_key_falls_back_to_keyword():
+    armored = armor(bytes([0x99, 0, 5]) + b"\x04")
+    installed = {"12345678": "Debian Stable Release Key"}
+
+    assert shaper.dnf.rpm_key_installed(installed, "Debian", armored)
+    assert not shaper.dnf.rpm_key_installed(installed, "Fedora", armored)
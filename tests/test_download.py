@@ -0,0 +1,152 @@
+import hashlib
+import http.server
+import threading
+import urllib.request
+
+import pytest
+
+import shaper.download
+
+CONTENT = bytes(range(256)) * 1024
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        site = self.server.site
+        site["requests"].append(dict(self.headers))
+        body, etag = site["body"], site["etag"]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        offset = 0
+        ranged = self.headers.get("Range")
+        if ranged and self.headers.get("If-Range") == etag:
+            offset = int(ranged[len("bytes=") : -1])
+            if offset >= len(body):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {offset}-{len(body) - 1}/*")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body) - offset))
+        self.end_headers()
+        self.wfile.write(body[offset:])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def site(tmp_path, monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.site = {"body": CONTENT, "etag": '"one"', "requests": []}
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    cache = tmp_path / "downloads"
+    monkeypatch.setattr(shaper.download, "CACHE", cache)
+    monkeypatch.setattr(shaper.download, "INDEX", cache / "index.json")
+    opener = shaper.download.SafeOpener(
+        (
+            urllib.request.UnknownHandler,
+            urllib.request.HTTPDefaultErrorHandler,
+            shaper.download.PooledHTTPHandler,
+            urllib.request.HTTPErrorProcessor,
+        )
+    )
+    monkeypatch.setattr(shaper.download, "opener", opener)
+    server.site["url"] = f"http://127.0.0.1:{server.server_port}/file.bin"
+    yield server.site
+    server.shutdown()
+    server.server_close()
+
+
+def partial_path(url: str):
+    return shaper.download.CACHE / "partial" / hashlib.sha256(url.encode()).hexdigest()
+
+
+def test_unchanged_content_is_revalidated(site):
+    first = shaper.download.fetch_cached(site["url"])
+    second = shaper.download.fetch_cached(site["url"])
+
+    assert first == second
+    assert first.read_bytes() == CONTENT
+    assert first.name == hashlib.sha256(CONTENT).hexdigest()
+    assert site["requests"][1]["If-None-Match"] == '"one"'
+
+
+def test_changed_content_replaces_old_object(site):
+    old = shaper.download.fetch_cached(site["url"])
+    site["body"], site["etag"] = CONTENT[::-1], '"two"'
+
+    new = shaper.download.fetch_cached(site["url"])
+
+    assert new.read_bytes() == CONTENT[::-1]
+    assert not old.exists()
+
+
+def test_interrupted_transfer_resumes(site):
+    partial = partial_path(site["url"])
+    partial.parent.mkdir(parents=True)
+    partial.write_bytes(CONTENT[:1000])
+    shaper.download.update_index(site["url"], partial_validator='"one"')
+
+    cached = shaper.download.fetch_cached(site["url"])
+
+    assert cached.read_bytes() == CONTENT
+    assert site["requests"][0]["Range"] == "bytes=1000-"
+    assert site["requests"][0]["If-Range"] == '"one"'
+    assert not partial.exists()
+
+
+def test_changed_content_restarts_transfer(site):
+    partial = partial_path(site["url"])
+    partial.parent.mkdir(parents=True)
+    partial.write_bytes(b"stale")
+    shaper.download.update_index(site["url"], partial_validator='"old"')
+
+    assert shaper.download.fetch_cached(site["url"]).read_bytes() == CONTENT
+
+
+def test_unsatisfiable_range_restarts_transfer(site):
+    partial = partial_path(site["url"])
+    partial.parent.mkdir(parents=True)
+    partial.write_bytes(CONTENT + b"extra")
+    shaper.download.update_index(site["url"], partial_validator='"one"')
+
+    assert shaper.download.fetch_cached(site["url"]).read_bytes() == CONTENT
+    assert "Range" not in site["requests"][1]
+
+
+def test_checksum_failure_discards_content(site):
+    with pytest.raises(shaper.download.ChecksumError):
+        shaper.download.fetch_cached(site["url"], {"sha256": "0" * 64})
+
+    entry = shaper.download.read_index()[site["url"]]
+    assert "partial_validator" not in entry
+    assert "sha256" not in entry
+    assert not partial_path(site["url"]).exists()
+    assert not (shaper.download.CACHE / "objects").exists()
+
+
+def test_cached_content_is_verified(site):
+    shaper.download.fetch_cached(site["url"])
+
+    with pytest.raises(shaper.download.ChecksumError):
+        shaper.download.fetch_cached(site["url"], {"sha256": "0" * 64})
+    assert "sha256" not in shaper.download.read_index()[site["url"]]
+
+
+def test_fresh_content_is_not_requested(site):
+    first = shaper.download.fetch_cached(site["url"], ttl=60)
+    second = shaper.download.fetch_cached(site["url"], ttl=60)
+
+    assert first == second
+    assert len(site["requests"]) == 1
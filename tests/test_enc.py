@@ -0,0 +1,153 @@
+import copy
+import io
+import stat
+
+import pytest
+
+bindings = pytest.importorskip("nacl.bindings")
+exceptions = pytest.importorskip("nacl.exceptions")
+
+import shaper.enc  # noqa: E402
+
+CHUNK = shaper.enc.STREAM_CHUNK
+LENGTH = shaper.enc.LENGTH
+DATA = bytes(range(256)) * (CHUNK // 128)
+
+
+@pytest.fixture(scope="module")
+def unlocked() -> shaper.enc.Keyring:
+    return shaper.enc.Keyring.unlock("correct horse")
+
+
+@pytest.fixture
+def keyring(unlocked) -> shaper.enc.Keyring:
+    # A fresh copy per test, without deriving the key again
+    return shaper.enc.Keyring(unlocked.key, copy.deepcopy(unlocked.vault))
+
+
+def encrypted(secret, data: bytes = DATA, binary: bool = False) -> bytes:
+    destination = io.BytesIO()
+    shaper.enc.encrypt_stream(secret, io.BytesIO(data), destination, binary)
+    return destination.getvalue()
+
+
+def decrypted(secret, ciphertext: bytes) -> bytes:
+    destination = io.BytesIO()
+    shaper.enc.decrypt_stream(secret, io.BytesIO(ciphertext), destination)
+    return destination.getvalue()
+
+
+def test_vault_round_trip(tmp_path, keyring):
+    path = tmp_path / "vault.json"
+    keyring.encrypt_all({"token": "s3cret", "empty": ""})
+    shaper.enc.save_vault(path, keyring)
+
+    reopened = shaper.enc.unlock_vault("correct horse", path)
+    assert reopened.decrypt_all(["token", "empty"]) == {"token": "s3cret", "empty": ""}
+
+
+def test_vault_wrong_password(tmp_path, keyring):
+    path = tmp_path / "vault.json"
+    shaper.enc.save_vault(path, keyring)
+
+    with pytest.raises(exceptions.CryptoError):
+        shaper.enc.unlock_vault("wrong horse", path)
+
+
+def test_vault_file_is_private(tmp_path, keyring):
+    path = tmp_path / "vault.json"
+    shaper.enc.save_vault(path, keyring)
+    shaper.enc.save_vault(path, keyring)
+
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    assert [p.name for p in tmp_path.iterdir()] == ["vault.json"]
+
+
+def test_swapped_secrets_are_detected(keyring):
+    keyring["first"] = "one"
+    keyring["second"] = "two"
+    secrets = keyring.vault["secrets"]
+    secrets["first"], secrets["second"] = secrets["second"], secrets["first"]
+
+    with pytest.raises(ValueError):
+        keyring["first"]
+
+
+def test_vault_limits_are_checked(keyring):
+    vault = dict(keyring.vault, opslimit=1 << 40)
+
+    with pytest.raises(ValueError):
+        shaper.enc.Keyring.unlock("correct horse", vault)
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_stream_round_trip(keyring, binary):
+    assert decrypted(keyring, encrypted(keyring, DATA, binary)) == DATA
+    assert decrypted(keyring, encrypted(keyring, b"", binary)) == b""
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_password_stream_round_trip(binary):
+    ciphertext = encrypted("correct horse", b"hello", binary)
+
+    assert decrypted("correct horse", ciphertext) == b"hello"
+    with pytest.raises(exceptions.CryptoError):
+        decrypted("wrong horse", ciphertext)
+
+
+def test_stream_wrong_key(keyring):
+    other = shaper.enc.Keyring(bytes(32), {})
+
+    with pytest.raises(exceptions.CryptoError):
+        decrypted(other, encrypted(keyring))
+
+
+def without_final_record(ciphertext: bytes, binary: bool) -> bytes:
+    if not binary:
+        return ciphertext[: ciphertext.rstrip(b"\n").rfind(b"\n") + 1]
+    # DATA fills whole chunks, so the final record holds a full chunk
+    final = LENGTH.size + CHUNK + bindings.crypto_secretstream_xchacha20poly1305_ABYTES
+    return ciphertext[:-final]
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_truncated_stream(keyring, binary):
+    ciphertext = encrypted(keyring, DATA, binary)
+
+    with pytest.raises(ValueError):
+        decrypted(keyring, without_final_record(ciphertext, binary))
+    with pytest.raises((ValueError, exceptions.CryptoError)):
+        # Past the newline, into the final record
+        decrypted(keyring, ciphertext[:-2])
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_trailing_data(keyring, binary):
+    ciphertext = encrypted(keyring, DATA, binary)
+
+    with pytest.raises(ValueError):
+        decrypted(keyring, ciphertext + encrypted(keyring, b"more", binary))
+
+
+def test_file_round_trip(tmp_path, keyring):
+    plain = tmp_path / "plain"
+    plain.write_bytes(DATA)
+    sealed = tmp_path / "sealed"
+    opened = tmp_path / "opened"
+
+    shaper.enc.encrypt_file(keyring, plain, sealed, binary=True)
+    shaper.enc.decrypt_file(keyring, sealed, opened)
+
+    assert opened.read_bytes() == DATA
+    assert stat.S_IMODE(sealed.stat().st_mode) == 0o600
+    assert stat.S_IMODE(opened.stat().st_mode) == 0o600
+
+
+def test_failed_decrypt_leaves_no_file(tmp_path, keyring):
+    sealed = tmp_path / "sealed"
+    sealed.write_bytes(encrypted(keyring)[:-2])
+    opened = tmp_path / "opened"
+
+    with pytest.raises((ValueError, exceptions.CryptoError)):
+        shaper.enc.decrypt_file(keyring, sealed, opened)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["sealed"]
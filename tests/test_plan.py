@@ -0,0 +1,39 @@
+import pytest
+
+import shaper.plan
+import shaper.steps
+
+
+def install(filename, force=False, jobs=4):
+    raise AssertionError("plan must not install")
+
+
+def missing(filename, force=False):
+    return {f"{filename} force={force}"}
+
+
+@pytest.fixture
+def planners(monkeypatch):
+    monkeypatch.setitem(shaper.plan.PLANNERS, install, missing)
+
+
+def step(*args, **kwargs):
+    return shaper.steps.Step("example", install, args, kwargs, ())
+
+
+def test_keyword_arguments_reach_the_planner(planners):
+    report = shaper.plan.plan_step(step("list.txt", force=True))
+
+    assert report["pending"] == ["list.txt force=True"]
+
+
+def test_install_only_keyword_arguments_are_dropped(planners):
+    report = shaper.plan.plan_step(step("list.txt", jobs=1))
+
+    assert report["pending"] == ["list.txt force=False"]
+
+
+def test_planner_errors_are_reported(planners):
+    report = shaper.plan.plan_step(step())
+
+    assert report["error"].startswith("TypeError")
@@ -11,45 +11,112 @@ import shaper.localpy
 import shaper.minecraft
 import shaper.npm
 import shaper.rust
+import shaper.steps
 
 BASE = Path.home() / "shaper"
 
 
-def run() -> None:
-    """Run commands in order."""
-    shaper.dnf.install_rpm_keys(f"{BASE}/packages/rpm_keys.json")
-    shaper.dnf.install_dnf_repos(f"{BASE}/repos/headless_repos.txt")
-    shaper.dnf.install_dnf_repos(f"{BASE}/repos/headless_copr_repos.txt")
-    shaper.dnf.install_dnf_repos(f"{BASE}/repos/workstation_repos.txt")
-    shaper.dnf.install_copr_repos(f"{BASE}/repos/workstation_copr_repos.txt")
-    shaper.dnf.install_rpmfusion()
-    shaper.dnf.install_dnf_packages(f"{BASE}/packages/base_dnf.txt")
-    shaper.npm.install_npm_packages(f"{BASE}/packages/base_npm.txt")
-    print("Installing Python packages...")
-    shaper.localpy.install_pip_packages(f"{BASE}/packages/base_pip.txt")
-    print("Installing fonts...")
-    shaper.fonts.install_fonts(f"{BASE}/fonts/workstation-fonts.txt")
-    print("Installing Rust...")
-    shaper.download.install_with_remote_script(
-        "rustup", "https://sh.rustup.rs", ["-y", "--no-modify-path"]
-    )
-    print("Dotfiles...")
-    shaper.dotfiles.dotfile_git_restore(
-        "base", "git@github.com:bowmanjd/dotfiles-base.git"
-    )
-    shaper.dotfiles.dotfile_git_restore(
-        "headless", "git@github.com:bowmanjd/dotfiles-headless.git"
-    )
-    shaper.dotfiles.dotfile_git_restore(
-        "workstation", "git@github.com:bowmanjd/dotfiles-workstation.git"
-    )
-    print("Installing Go...")
-    shaper.golang.go_update()
-    shaper.golang.install_go_packages(f"{BASE}/packages/base_go.txt")
-    print("Installing Cargo (Rust) packages...")
-    shaper.rust.install_rust_packages(f"{BASE}/packages/base_rust.txt")
-    shaper.minecraft.multimc_update()
+def playbook() -> shaper.steps.Playbook:
+    """Declare steps and their dependencies.
+
+    Returns:
+        the playbook
+    """
+    book = shaper.steps.Playbook()
+    book.add("rpm_keys", shaper.dnf.install_rpm_keys, f"{BASE}/packages/rpm_keys.json")
+    book.add(
+        "headless_repos",
+        shaper.dnf.install_dnf_repos,
+        f"{BASE}/repos/headless_repos.txt",
+        after=["rpm_keys"],
+    )
+    book.add(
+        "headless_copr_repos",
+        shaper.dnf.install_dnf_repos,
+        f"{BASE}/repos/headless_copr_repos.txt",
+        after=["headless_repos"],
+    )
+    book.add(
+        "workstation_repos",
+        shaper.dnf.install_dnf_repos,
+        f"{BASE}/repos/workstation_repos.txt",
+        after=["headless_copr_repos"],
+    )
+    book.add(
+        "workstation_copr_repos",
+        shaper.dnf.install_copr_repos,
+        f"{BASE}/repos/workstation_copr_repos.txt",
+        after=["workstation_repos"],
+    )
+    book.add(
+        "rpmfusion", shaper.dnf.install_rpmfusion, after=["workstation_copr_repos"]
+    )
+    book.add(
+        "dnf_packages",
+        shaper.dnf.install_dnf_packages,
+        f"{BASE}/packages/base_dnf.txt",
+        after=["rpmfusion"],
+    )
+    book.add("volta", shaper.npm.install_volta)
+    book.add(
+        "npm_packages",
+        shaper.npm.install_npm_packages,
+        f"{BASE}/packages/base_npm.txt",
+        after=["volta"],
+    )
+    book.add(
+        "pip_packages",
+        shaper.localpy.install_pip_packages,
+        f"{BASE}/packages/base_pip.txt",
+        after=["dnf_packages"],
+    )
+    book.add(
+        "fonts", shaper.fonts.install_fonts, f"{BASE}/fonts/workstation-fonts.txt"
+    )
+    book.add(
+        "rustup",
+        shaper.download.install_with_remote_script,
+        "rustup",
+        "https://sh.rustup.rs",
+        ["-y", "--no-modify-path"],
+    )
+    book.add(
+        "dotfiles_base",
+        shaper.dotfiles.dotfile_git_restore,
+        "base",
+        "git@github.com:bowmanjd/dotfiles-base.git",
+        after=["dnf_packages"],
+    )
+    book.add(
+        "dotfiles_headless",
+        shaper.dotfiles.dotfile_git_restore,
+        "headless",
+        "git@github.com:bowmanjd/dotfiles-headless.git",
+        after=["dnf_packages"],
+    )
+    book.add(
+        "dotfiles_workstation",
+        shaper.dotfiles.dotfile_git_restore,
+        "workstation",
+        "git@github.com:bowmanjd/dotfiles-workstation.git",
+        after=["dnf_packages"],
+    )
+    book.add("go", shaper.golang.go_update)
+    book.add(
+        "go_packages",
+        shaper.golang.install_go_packages,
+        f"{BASE}/packages/base_go.txt",
+        after=["go", "dnf_packages"],
+    )
+    book.add(
+        "rust_packages",
+        shaper.rust.install_rust_packages,
+        f"{BASE}/packages/base_rust.txt",
+        after=["rustup", "dnf_packages"],
+    )
+    book.add("minecraft", shaper.minecraft.multimc_update)
+    return book
 
 
 if __name__ == "__main__":
-    run()
+    playbook().main()
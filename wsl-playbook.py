@@ -3,13 +3,27 @@
 
 import shaper.dotfiles
 import shaper.dnf
+import shaper.steps
 
-def run() -> None:
-    """Run commands in order."""
-    #shaper.dotfiles.dotfiles_ssh(SSH_SECRET_REPO)
-    shaper.dnf.install_dnf_packages("packages/wsl_dnf.txt")
-    shaper.dotfiles.dotfile_git_restore("wsl", "git@github.com:bowmanjd/dotfiles-wsl.git")
 
-if __name__ == "__main__":
-    run()
+def playbook() -> shaper.steps.Playbook:
+    """Declare steps and their dependencies.
+
+    Returns:
+        the playbook
+    """
+    book = shaper.steps.Playbook()
+    # book.add("dotfiles_ssh", shaper.dotfiles.dotfiles_ssh, SSH_SECRET_REPO)
+    book.add("dnf_packages", shaper.dnf.install_dnf_packages, "packages/wsl_dnf.txt")
+    book.add(
+        "dotfiles_wsl",
+        shaper.dotfiles.dotfile_git_restore,
+        "wsl",
+        "git@github.com:bowmanjd/dotfiles-wsl.git",
+        after=["dnf_packages"],
+    )
+    return book
 
+
+if __name__ == "__main__":
+    playbook().main()